@@ -0,0 +1,124 @@
+"""Response compression for large JSON payloads"""
+import gzip
+from typing import List, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; gzip is always available
+    brotli = None
+
+# gzip level and Brotli quality: fast settings, most of the size win for
+# repetitive JSON at a fraction of the CPU of the maximum levels
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+# Content types worth compressing
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+
+
+def accepted_encodings(accept_encoding: str) -> List[str]:
+    """List the codings an Accept-Encoding header allows (q > 0)"""
+    encodings = []
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding and quality > 0:
+            encodings.append(coding.strip().lower())
+    return encodings
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick Brotli when installed and accepted, else gzip, else None"""
+    encodings = accepted_encodings(accept_encoding)
+    if brotli is not None and "br" in encodings:
+        return "br"
+    if "gzip" in encodings:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """Compress a response body with the chosen coding"""
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing large, complete JSON and text responses
+
+    Only responses sent as a single body message are compressed, so
+    streamed responses (e.g. /api/recommend/stream) pass through untouched
+    and every event still reaches the client as soon as it is sent.
+
+    Every JSON or text response gets Vary: Accept-Encoding, compressed or
+    not, since another request for it could have been answered compressed.
+    """
+
+    def __init__(self, app, minimum_size: int):
+        """
+        Args:
+            app: ASGI application
+            minimum_size: Smallest body, in bytes, worth compressing
+        """
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        start_message = None
+        streaming = False
+
+        async def send_compressed(message):
+            nonlocal start_message, streaming
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(raw=list(message.get("headers", [])))
+                if self._negotiated(headers):
+                    headers.add_vary_header("Accept-Encoding")
+                    message = {**message, "headers": headers.raw}
+                if encoding is None:
+                    await send(message)
+                else:
+                    start_message = message
+                return
+            if message["type"] != "http.response.body" or streaming or start_message is None:
+                await send(message)
+                return
+
+            headers = MutableHeaders(raw=list(start_message.get("headers", [])))
+            body = message.get("body", b"")
+            if message.get("more_body", False) or not self._compressible(headers, body):
+                # Send the response as is, from the first chunk onwards
+                streaming = True
+                await send(start_message)
+                await send(message)
+                return
+
+            body = compress(body, encoding)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            await send({**start_message, "headers": headers.raw})
+            await send({**message, "body": body})
+
+        await self.app(scope, receive, send_compressed)
+
+    @staticmethod
+    def _negotiated(headers: MutableHeaders) -> bool:
+        """Return True for uncompressed JSON or text responses, whose encoding depends on Accept-Encoding"""
+        return "content-encoding" not in headers and headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+
+    def _compressible(self, headers: MutableHeaders, body: bytes) -> bool:
+        """Return True for uncompressed JSON or text bodies of at least minimum_size"""
+        return len(body) >= self.minimum_size and self._negotiated(headers)
@@ -12,8 +12,128 @@ class Settings(BaseSettings):
     # API Keys
     GEMINI_API_KEY: str
     GEMINI_MODEL: str = "gemini-1.5-flash"
+    GEMINI_MAX_CONCURRENCY: int = 8
+    GEMINI_TIMEOUT: float = 20.0
     TMDB_API_KEY: str
     
+    # TMDB HTTP client
+    TMDB_TIMEOUT: float = 30.0
+    TMDB_CONNECT_TIMEOUT: float = 15.0
+    TMDB_MAX_CONNECTIONS: int = 100
+    TMDB_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    TMDB_KEEPALIVE_EXPIRY: float = 30.0
+    TMDB_HTTP2: bool = False
+    
+    # TMDB response cache (TTL in seconds, 0 disables caching for an endpoint)
+    TMDB_CACHE_MAX_SIZE: int = 2048
+    TMDB_DISCOVER_CACHE_TTL: int = 600
+    TMDB_SEARCH_CACHE_TTL: int = 300
+    TMDB_DETAILS_CACHE_TTL: int = 3600
+    
+    # Background prefetch of the next discover pages (0 disables)
+    TMDB_PREFETCH_PAGES: int = 1
+    TMDB_PREFETCH_MAX_CONCURRENCY: int = 4
+    
+    # Batched movie detail lookups (/api/movies/batch)
+    TMDB_DETAILS_MAX_CONCURRENCY: int = 10
+    TMDB_DETAILS_BATCH_MAX_SIZE: int = 100
+    
+    # Upstream rate limits (requests per second and burst size per provider)
+    TMDB_RATE_LIMIT: float = 40.0
+    TMDB_RATE_BURST: int = 20
+    GEMINI_RATE_LIMIT: float = 5.0
+    GEMINI_RATE_BURST: int = 10
+    
+    # Upstream retries (jittered exponential backoff, honoring Retry-After)
+    TMDB_MAX_RETRIES: int = 3
+    GEMINI_MAX_RETRIES: int = 1
+    UPSTREAM_BACKOFF_BASE: float = 0.2
+    UPSTREAM_BACKOFF_MAX: float = 5.0
+    UPSTREAM_MAX_WAIT: float = 5.0
+    
+    # Upstream circuit breakers
+    UPSTREAM_FAILURE_THRESHOLD: int = 5
+    UPSTREAM_RESET_TIMEOUT: float = 30.0
+    
+    # Local TMDB catalog mirror (filled by `python -m app.services.catalog_service`)
+    CATALOG_ENABLED: bool = False
+    CATALOG_MAX_AGE: int = 86400
+    CATALOG_SYNC_PAGES: int = 25
+    CATALOG_SYNC_TOP_COMBINATIONS: int = 50
+    
+    # Mood cache ("memory" or "sql" to share entries through the database)
+    MOOD_CACHE_BACKEND: str = "memory"
+    MOOD_CACHE_TTL: int = 86400
+    MOOD_CACHE_MAX_SIZE: int = 10000
+    
+    # Local mood classifier (answers before Gemini when confident enough)
+    MOOD_CLASSIFIER_ENABLED: bool = True
+    MOOD_CLASSIFIER_THRESHOLD: float = 0.8
+    
+    # Similarity index answering near-duplicate moods (cosine threshold in [0, 1])
+    MOOD_SIMILARITY_ENABLED: bool = True
+    MOOD_SIMILARITY_THRESHOLD: float = 0.8
+    MOOD_SIMILARITY_MAX_SIZE: int = 10000
+    
+    # Pipeline mode: resolve genres with a short prompt, then fetch movies
+    # while the explanation is written (seconds before a template is used)
+    RECOMMENDATION_PIPELINE: bool = False
+    EXPLANATION_DEADLINE: float = 3.0
+    
+    # Micro-batching: moods arriving within GEMINI_BATCH_WINDOW seconds (or
+    # GEMINI_BATCH_MAX_SIZE of them) are resolved in one Gemini call. In
+    # pipeline mode only the genre call is batched; explanations and
+    # /api/recommend/stream still make one call per mood.
+    GEMINI_BATCH_ENABLED: bool = False
+    GEMINI_BATCH_WINDOW: float = 0.02
+    GEMINI_BATCH_MAX_SIZE: int = 10
+    
+    # Multi-genre fan-out: query each genre and genre pair concurrently and
+    # merge them by a weighted score instead of the strict intersection
+    # (at most FANOUT_MAX_CALLS discover pages per request, and at most
+    # FANOUT_MAX_PAGES pages of any one genre combination)
+    DISCOVER_FANOUT: bool = False
+    FANOUT_MAX_CALLS: int = 14
+    FANOUT_MAX_PAGES: int = 10
+    FANOUT_WEIGHT_POPULARITY: float = 0.4
+    FANOUT_WEIGHT_RATING: float = 0.3
+    FANOUT_WEIGHT_OVERLAP: float = 0.3
+    
+    # In-process set of favourited movie IDs, reloaded after this many
+    # seconds so other workers' changes show up (0 to never reload)
+    FAVOURITE_IDS_MAX_AGE: float = 60.0
+    
+    # Bulk favourites import (rows per INSERT ... ON CONFLICT, item and
+    # request body limits) and export (rows per server-side cursor fetch)
+    FAVOURITES_IMPORT_CHUNK_SIZE: int = 500
+    FAVOURITES_IMPORT_MAX_ITEMS: int = 10000
+    FAVOURITES_IMPORT_MAX_BYTES: int = 10_000_000
+    FAVOURITES_EXPORT_BATCH_SIZE: int = 500
+    
+    # History write-behind queue
+    HISTORY_BATCH_SIZE: int = 100
+    HISTORY_FLUSH_INTERVAL: float = 1.0
+    HISTORY_QUEUE_MAX_SIZE: int = 10000
+    
+    # Warm-up of upstream connections after startup; /health reports 503
+    # until it completes
+    WARMUP_ENABLED: bool = True
+    WARMUP_TIMEOUT: float = 10.0
+    
+    # gzip/Brotli compression of complete JSON responses of at least
+    # RESPONSE_COMPRESSION_MIN_SIZE bytes (Brotli needs the brotli package)
+    RESPONSE_COMPRESSION: bool = False
+    RESPONSE_COMPRESSION_MIN_SIZE: int = 1024
+    
+    # HTTP caching of GET /api/recommend: how long ETags are remembered to
+    # answer If-None-Match with 304 without calling Gemini or TMDB, and the
+    # private Cache-Control max-age (0 for no-cache: browsers revalidate every
+    # use, as is_favourite flags can change; above 0, they may show stale
+    # flags for that long)
+    RECOMMEND_CACHE_MAX_AGE: int = 0
+    RECOMMEND_ETAG_TTL: int = 600
+    RECOMMEND_ETAG_MAX_SIZE: int = 10000
+    
     # Server
     HOST: str = "0.0.0.0"
     PORT: int = 8000
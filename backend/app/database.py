@@ -1,34 +1,134 @@
 """Database configuration and session management"""
-from sqlalchemy import create_engine
+import time
+from sqlalchemy import event, inspect
+from sqlalchemy.engine import make_url, URL
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 from .config import settings
+from .metrics import record_stage
 
-# Create database engine
-engine = create_engine(
-    settings.DATABASE_URL,
+# asyncio drivers used for DATABASE_URLs that name a sync (or no) driver
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+}
+
+
+def get_async_url(database_url: str) -> URL:
+    """
+    Resolve DATABASE_URL to an asyncio-capable URL
+
+    URLs that already name an async driver (e.g. postgresql+asyncpg://)
+    are used as-is; plain postgresql:// and sqlite:// URLs are mapped to
+    asyncpg and aiosqlite.
+    """
+    url = make_url(database_url)
+    if url.drivername in ASYNC_DRIVERS:
+        url = url.set(drivername=ASYNC_DRIVERS[url.drivername])
+    return url
+
+
+# Create database engine (SQLite connections are not pooled by aiosqlite)
+database_url = get_async_url(settings.DATABASE_URL)
+pool_options = {} if database_url.get_backend_name() == "sqlite" else {"pool_size": 10, "max_overflow": 20}
+engine = create_async_engine(
+    database_url,
     pool_pre_ping=True,
-    pool_size=10,
-    max_overflow=20
+    **pool_options
 )
 
+
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    """Remember when a statement started, for the db stage timing"""
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    """Record statement execution time as the db stage"""
+    record_stage("db", time.perf_counter() - conn.info["query_start_time"].pop())
+
+
+@event.listens_for(engine.sync_engine, "handle_error")
+def _discard_query_timer(exception_context):
+    """Drop the timer of a statement that failed"""
+    starts = exception_context.connection.info.get("query_start_time") if exception_context.connection else None
+    if starts:
+        starts.pop()
+
+
 # Create session factory
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = async_sessionmaker(
+    bind=engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
 
 # Base class for models
 Base = declarative_base()
 
 
-def get_db():
+# Databases whose dialect insert() supports ON CONFLICT, which the
+# history writer, mood cache, catalog and favourites import rely on
+UPSERT_DIALECTS = ("postgresql", "sqlite")
+
+
+def dialect_insert(table):
+    """
+    Build an INSERT for the configured database that supports ON CONFLICT
+    
+    PostgreSQL and SQLite both expose on_conflict_do_update() and
+    on_conflict_do_nothing() on their dialect-specific insert(). init_db
+    refuses to start on any other database.
+    """
+    if engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif engine.dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"Upserts are not supported for {engine.dialect.name}")
+    return insert(table)
+
+
+async def get_db():
     """Dependency for getting database session"""
-    db = SessionLocal()
-    try:
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
-def init_db():
-    """Initialize database tables"""
+def _create_indexes(connection):
+    """Create indexes added to models after their table already existed"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
+def _table_names(connection):
+    """List the tables that already exist"""
+    return inspect(connection).get_table_names()
+
+
+async def init_db():
+    """
+    Initialize database tables and indexes, backfilling newly added tables
+    
+    Raises:
+        RuntimeError: The database does not support the upserts the app uses
+    """
+    if engine.dialect.name not in UPSERT_DIALECTS:
+        raise RuntimeError(
+            f"Unsupported database {engine.dialect.name}: DATABASE_URL must point at "
+            f"one of {', '.join(UPSERT_DIALECTS)}"
+        )
     from .models import models
-    Base.metadata.create_all(bind=engine)
+    from .services import search_stats
+    async with engine.begin() as conn:
+        existing_tables = await conn.run_sync(_table_names)
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_create_indexes)
+        await conn.run_sync(search_stats.backfill, existing_tables)
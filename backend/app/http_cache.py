@@ -0,0 +1,58 @@
+"""ETag and Cache-Control support for cacheable GET endpoints"""
+import hashlib
+from typing import Dict, Optional
+
+import orjson
+from fastapi import Response
+
+from .config import settings
+from .services.cache import TTLCache
+
+# Lists change with every write, so caches must revalidate each use
+LIST_CACHE_CONTROL = "no-cache"
+# Degraded responses (e.g. fallback genres) must not be reused
+NO_STORE = "no-store"
+
+
+def request_key(*parts) -> str:
+    """Stable hash of the normalized inputs that determine a response"""
+    return hashlib.sha256(orjson.dumps(parts)).hexdigest()
+
+
+def make_etag(content: bytes) -> str:
+    """
+    Weak ETag for a response's content
+
+    Weak, because equivalent responses share it even when fields that do
+    not change their meaning (such as the mood resolution source) or the
+    Content-Encoding differ.
+    """
+    return f'W/"{hashlib.blake2b(content, digest_size=16).hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Compare an If-None-Match header with an ETag (weak comparison)"""
+    if not if_none_match:
+        return False
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+
+def cached_response(
+    body: bytes,
+    etag: str,
+    cache_control: str,
+    if_none_match: Optional[str],
+    headers: Optional[Dict[str, str]] = None
+) -> Response:
+    """Send the body with its ETag, or 304 when the client already has it"""
+    headers = {**(headers or {}), "ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+# ETags of recent GET /api/recommend responses by request_key, with the
+# movies they listed and which of those were favourites, so If-None-Match
+# can be answered without calling Gemini or TMDB
+recommend_etags = TTLCache(maxsize=settings.RECOMMEND_ETAG_MAX_SIZE, ttl=settings.RECOMMEND_ETAG_TTL)
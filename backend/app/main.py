@@ -1,11 +1,23 @@
 """FastAPI main application"""
-from fastapi import FastAPI
+import asyncio
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, PlainTextResponse
 from contextlib import asynccontextmanager
 
+from .compression import CompressionMiddleware
 from .config import settings
-from .database import init_db
+from .database import engine, init_db
+from .metrics import REGISTRY, ServerTimingMiddleware, counter_family, gauge_family
 from .routers import api
+from .services.catalog_service import catalog
+from .services.gemini_service import GeminiService
+from .services.history_writer import history_writer
+from .services.mood_cache import mood_cache
+from .services.mood_index import mood_index
+from .services.recommendation_service import RecommendationService
+from .services.tmdb_service import TMDBService
+from .services.upstream import upstreams
 
 
 @asynccontextmanager
@@ -16,13 +28,31 @@ async def lifespan(app: FastAPI):
     logger = logging.getLogger("uvicorn")
     logger.info("Starting FavourFlix-AI Backend...")
     logger.info("Initializing database...")
-    init_db()
+    await init_db()
     logger.info("Database initialized successfully")
+    # Startup: Create shared services and open pools
+    app.state.ready = False
+    recommendation_service = RecommendationService()
+    await recommendation_service.startup()
+    app.state.recommendation_service = recommendation_service
+    
+    # Upstreams are warmed up once the server is accepting connections, so
+    # /health reports 503 until that is done
+    async def warm_up():
+        await recommendation_service.warm_up()
+        app.state.ready = True
+        logger.info("Services warmed up")
+    
+    warm_up_task = asyncio.create_task(warm_up())
     yield
     # Shutdown: Clean up resources
     logger.info("Shutting down FavourFlix-AI Backend...")
-    from .services.tmdb_service import TMDBService
-    await TMDBService.close_client()
+    app.state.ready = False
+    app.state.stopping = True
+    warm_up_task.cancel()
+    await asyncio.gather(warm_up_task, return_exceptions=True)
+    await recommendation_service.shutdown()
+    await engine.dispose()
     logger.info("Cleanup completed")
 
 
@@ -31,7 +61,8 @@ app = FastAPI(
     title="FavourFlix-AI API",
     description="AI-powered movie recommendation platform with mood-based search",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # Configure CORS
@@ -41,8 +72,16 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Server-Timing", "Retry-After", "ETag"],
 )
 
+# Compress large complete responses (streamed responses pass through)
+if settings.RESPONSE_COMPRESSION:
+    app.add_middleware(CompressionMiddleware, minimum_size=settings.RESPONSE_COMPRESSION_MIN_SIZE)
+
+# Report per-stage timings in a Server-Timing header
+app.add_middleware(ServerTimingMiddleware)
+
 # Include routers
 app.include_router(api.router)
 
@@ -58,9 +97,137 @@ async def root():
 
 
 @app.get("/health")
-async def health_check():
-    """Health check endpoint"""
-    return {"status": "healthy"}
+async def health_check(request: Request):
+    """
+    Health check endpoint for readiness probes
+    
+    503 while upstreams are still being warmed up after startup, and again
+    once shutdown has begun, so load balancers drain the instance
+    """
+    if not getattr(request.app.state, "ready", False):
+        status = "stopping" if getattr(request.app.state, "stopping", False) else "starting"
+        return ORJSONResponse(status_code=503, content={"status": status})
+    return {"status": "healthy", "history_writer": history_writer.stats()}
+
+
+def collect_service_metrics():
+    """Report cache, prefetch, upstream and history writer state for /metrics"""
+    mood_stats = mood_cache.stats()
+    yield counter_family(
+        "favourflix_mood_cache_lookups",
+        "Mood cache lookups by result",
+        [({"result": "hit"}, mood_stats["hits"]), ({"result": "miss"}, mood_stats["misses"])]
+    )
+    yield gauge_family("favourflix_mood_cache_hit_ratio", "Mood cache hit ratio", [({}, mood_stats["hit_ratio"])])
+    yield gauge_family("favourflix_mood_cache_size", "Moods held in the in-process cache", [({}, mood_stats["size"])])
+    
+    index_stats = mood_index.stats()
+    yield counter_family(
+        "favourflix_mood_similarity_lookups",
+        "Mood similarity index lookups by result",
+        [({"result": "hit"}, index_stats["hits"]), ({"result": "miss"}, index_stats["misses"])]
+    )
+    yield gauge_family("favourflix_mood_similarity_hit_ratio", "Mood similarity index hit ratio", [({}, index_stats["hit_ratio"])])
+    yield gauge_family("favourflix_mood_similarity_size", "Moods held in the similarity index", [({}, index_stats["size"])])
+    
+    tmdb_stats = TMDBService.cache_stats()
+    endpoints = ("discover", "search", "details")
+    yield counter_family(
+        "favourflix_tmdb_cache_lookups",
+        "TMDB response cache lookups by endpoint and result",
+        [({"endpoint": name, "result": "hit"}, tmdb_stats[name]["hits"]) for name in endpoints]
+        + [({"endpoint": name, "result": "miss"}, tmdb_stats[name]["misses"]) for name in endpoints]
+    )
+    yield gauge_family(
+        "favourflix_tmdb_cache_hit_ratio",
+        "TMDB response cache hit ratio by endpoint",
+        [({"endpoint": name}, tmdb_stats[name]["hit_ratio"]) for name in endpoints]
+    )
+    yield gauge_family(
+        "favourflix_tmdb_cache_size",
+        "TMDB responses held in cache by endpoint",
+        [({"endpoint": name}, tmdb_stats[name]["size"]) for name in endpoints]
+    )
+    yield counter_family(
+        "favourflix_tmdb_coalesced_requests",
+        "TMDB requests served by joining an identical in-flight request",
+        [({}, tmdb_stats["coalesced"])]
+    )
+    prefetch = tmdb_stats["prefetch"]
+    yield counter_family(
+        "favourflix_tmdb_prefetch",
+        "TMDB discover prefetches by event",
+        [({"event": event}, prefetch[event]) for event in ("scheduled", "skipped", "failed", "cancelled", "hits")]
+    )
+    yield gauge_family("favourflix_tmdb_prefetch_hit_ratio", "Share of completed prefetches later served", [({}, prefetch["hit_ratio"])])
+    yield gauge_family("favourflix_tmdb_prefetch_in_flight", "TMDB prefetches currently running", [({}, prefetch["in_flight"])])
+    
+    batch_stats = GeminiService.batch_stats()
+    yield counter_family("favourflix_gemini_batches", "Batched Gemini mood resolution calls", [({}, batch_stats["batches"])])
+    yield counter_family(
+        "favourflix_gemini_batched_moods",
+        "Moods answered by batched Gemini calls, and moods sent again in a retry batch",
+        [({"outcome": outcome}, batch_stats[outcome]) for outcome in ("answered", "retried")]
+    )
+    
+    catalog_stats = catalog.stats()
+    yield counter_family(
+        "favourflix_catalog_lookups",
+        "Catalog mirror discover lookups by result",
+        [({"result": result}, catalog_stats[key]) for result, key in (("hit", "hits"), ("stale_hit", "stale_hits"), ("miss", "misses"))]
+    )
+    
+    upstream_stats = {name: upstream.stats() for name, upstream in upstreams.items()}
+    yield gauge_family(
+        "favourflix_upstream_circuit_open",
+        "Upstream circuit breaker state (0 closed, 0.5 half-open, 1 open)",
+        [
+            ({"upstream": name}, {"closed": 0.0, "half_open": 0.5, "open": 1.0}[stats["circuit_state"]])
+            for name, stats in upstream_stats.items()
+        ]
+    )
+    yield counter_family(
+        "favourflix_upstream_circuit_opens",
+        "Times each upstream circuit breaker opened",
+        [({"upstream": name}, stats["circuit_opens"]) for name, stats in upstream_stats.items()]
+    )
+    yield gauge_family(
+        "favourflix_upstream_rate_limit",
+        "Current upstream rate limit in requests per second (lowered after throttling)",
+        [({"upstream": name}, stats["rate"]) for name, stats in upstream_stats.items()]
+    )
+    yield gauge_family(
+        "favourflix_upstream_rate_tokens",
+        "Rate limit tokens available (negative while calls are queued)",
+        [({"upstream": name}, stats["tokens"]) for name, stats in upstream_stats.items()]
+    )
+    yield counter_family(
+        "favourflix_upstream_events",
+        "Upstream retries, exhausted retries and calls rejected by the circuit breaker or rate limiter",
+        [
+            ({"upstream": name, "event": event}, stats[event])
+            for name, stats in upstream_stats.items()
+            for event in ("retries", "exhausted", "circuit_open", "rate_limited")
+        ]
+    )
+    
+    writer_stats = history_writer.stats()
+    yield gauge_family("favourflix_history_queue_depth", "Search history rows waiting to be written", [({}, writer_stats["queue_depth"])])
+    yield counter_family(
+        "favourflix_history_rows",
+        "Search history rows by outcome",
+        [({"outcome": outcome}, writer_stats[outcome]) for outcome in ("written", "dropped", "failed")]
+    )
+    yield counter_family("favourflix_history_batches", "Search history batches flushed", [({}, writer_stats["batches"])])
+
+
+REGISTRY.register_collector(collect_service_metrics)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics endpoint"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,226 @@
+"""Prometheus-style metrics and per-request stage timing"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# (labels, value) pairs reported by a metric
+Sample = Tuple[Dict[str, str], float]
+# (name, type, help, samples) reported by a collector at scrape time
+Family = Tuple[str, str, str, List[Sample]]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    """Escape a label value for the Prometheus text format"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    """Render labels in Prometheus text format"""
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    """Render a sample value in Prometheus text format"""
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Counter:
+    """Monotonically increasing value, optionally split by labels"""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        """Increase the counter for the given label values"""
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def collect(self) -> Family:
+        samples = [
+            (dict(zip(self.labelnames, key)), value)
+            for key, value in self._values.items()
+        ]
+        return self.name + "_total", self.type, self.documentation, samples
+
+
+class Histogram:
+    """Distribution of observed values in cumulative buckets"""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # label values -> [per-bucket counts, sum, count]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        """Record one observation for the given label values"""
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                state[0][index] += 1
+                break
+        state[1] += value
+        state[2] += 1
+
+    def collect(self) -> Family:
+        samples: List[Sample] = []
+        for key, (counts, total, count) in self._values.items():
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                samples.append(({**labels, "le": _format_value(bound)}, cumulative))
+            samples.append(({**labels, "__suffix__": "_sum"}, total))
+            samples.append(({**labels, "__suffix__": "_count"}, count))
+        return self.name, self.type, self.documentation, samples
+
+
+class Registry:
+    """Set of metrics and scrape-time collectors rendered for /metrics"""
+
+    def __init__(self):
+        self._metrics: List = []
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+
+    def register(self, metric):
+        """Add a Counter or Histogram and return it"""
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable[[], Iterable[Family]]) -> None:
+        """Add a function that reports metric families when scraped"""
+        self._collectors.append(collector)
+
+    def collect(self) -> Iterator[Family]:
+        for metric in self._metrics:
+            yield metric.collect()
+        for collector in self._collectors:
+            yield from collector()
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format"""
+        lines = []
+        for name, metric_type, documentation, samples in self.collect():
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in samples:
+                labels = dict(labels)
+                if metric_type == "histogram":
+                    suffix = labels.pop("__suffix__", "_bucket")
+                else:
+                    suffix = ""
+                lines.append(f"{name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "favourflix_stage_duration_seconds",
+    "Time spent in each recommendation pipeline stage",
+    ["stage"]
+))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "favourflix_request_duration_seconds",
+    "Total HTTP request handling time until the response starts",
+    ["method", "status"]
+))
+UPSTREAM_REQUESTS = REGISTRY.register(Counter(
+    "favourflix_upstream_requests",
+    "Calls to upstream APIs by outcome (HTTP status or error type)",
+    ["upstream", "outcome"]
+))
+
+# Stage durations for the request being handled, keyed by stage name
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    """Record time spent in a stage for metrics and the Server-Timing header"""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def track_stage(stage: str):
+    """Time the enclosed block as one pipeline stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+def gauge_family(name: str, documentation: str, samples: List[Sample]) -> Family:
+    """Build a gauge family for a collector"""
+    return name, "gauge", documentation, samples
+
+
+def counter_family(name: str, documentation: str, samples: List[Sample]) -> Family:
+    """Build a counter family for a collector from running totals"""
+    return name + "_total", "counter", documentation, samples
+
+
+class ServerTimingMiddleware:
+    """
+    ASGI middleware that reports per-request stage timings
+
+    Stages recorded with `track_stage` while handling a request are sent
+    back in a Server-Timing header, together with the total time until the
+    response starts.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings: Dict[str, float] = {}
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                total = time.perf_counter() - start
+                REQUEST_SECONDS.observe(total, method=scope["method"], status=message["status"])
+                entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items()]
+                entries.append(f"total;dur={total * 1000:.1f}")
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", ", ".join(entries).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_timings.reset(token)
@@ -1,12 +1,22 @@
 """SQLAlchemy database models"""
-from sqlalchemy import Column, Integer, String, Float, Text, DateTime
+from sqlalchemy import Column, Integer, String, Float, Text, DateTime, Index, ForeignKey
 from sqlalchemy.sql import func
+from datetime import datetime, timezone
 from ..database import Base
 
 
+def utcnow() -> datetime:
+    """Timezone-aware current time, used for consistent timestamp precision"""
+    return datetime.now(timezone.utc)
+
+
 class Favourite(Base):
     """Model for storing user's favourite movies"""
     __tablename__ = "favourites"
+    __table_args__ = (
+        # Keyset pagination order for the favourites list
+        Index("ix_favourites_created_at_id", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     movie_id = Column(Integer, unique=True, nullable=False, index=True)
@@ -16,7 +26,7 @@ class Favourite(Base):
     backdrop_path = Column(String)
     vote_average = Column(Float)
     release_date = Column(String)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), default=utcnow, server_default=func.now())
     
     def __repr__(self):
         return f"<Favourite(id={self.id}, movie_id={self.movie_id}, title='{self.title}')>"
@@ -25,12 +35,122 @@ class Favourite(Base):
 class History(Base):
     """Model for storing mood search history"""
     __tablename__ = "history"
+    __table_args__ = (
+        # Keyset pagination order for the history list
+        Index("ix_history_created_at_id", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     mood = Column(String, nullable=False)
     genres = Column(String, nullable=False)  # Comma-separated genre IDs
     explanation = Column(Text, nullable=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), default=utcnow, server_default=func.now())
     
     def __repr__(self):
         return f"<History(id={self.id}, mood='{self.mood}')>"
+
+
+class HistoryGenre(Base):
+    """Model indexing search history by genre"""
+    __tablename__ = "history_genres"
+    __table_args__ = (
+        # Serves "searches for genre X over a time range" without splitting strings
+        Index("ix_history_genres_genre_created_at", "genre_id", "created_at"),
+    )
+    
+    history_id = Column(Integer, ForeignKey("history.id", ondelete="CASCADE"), primary_key=True)
+    genre_id = Column(Integer, primary_key=True)
+    created_at = Column(DateTime(timezone=True), nullable=False)  # Copied from History for the index
+    
+    def __repr__(self):
+        return f"<HistoryGenre(history_id={self.history_id}, genre_id={self.genre_id})>"
+
+
+class HourlySearchRollup(Base):
+    """Model counting searches per genre and per mood in each UTC hour"""
+    __tablename__ = "search_rollups_hourly"
+    
+    bucket = Column(DateTime(timezone=True), primary_key=True)  # Start of the hour
+    dimension = Column(String, primary_key=True)  # "genre" or "mood"
+    key = Column(String, primary_key=True)  # Genre ID or normalized mood text
+    searches = Column(Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f"<HourlySearchRollup(bucket={self.bucket}, dimension='{self.dimension}', key='{self.key}')>"
+
+
+class DailySearchRollup(Base):
+    """Model counting searches per genre and per mood on each UTC day"""
+    __tablename__ = "search_rollups_daily"
+    
+    bucket = Column(DateTime(timezone=True), primary_key=True)  # Start of the day
+    dimension = Column(String, primary_key=True)  # "genre" or "mood"
+    key = Column(String, primary_key=True)  # Genre ID or normalized mood text
+    searches = Column(Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f"<DailySearchRollup(bucket={self.bucket}, dimension='{self.dimension}', key='{self.key}')>"
+
+
+class MoodCacheEntry(Base):
+    """Model for sharing resolved mood-to-genre mappings between workers"""
+    __tablename__ = "mood_cache"
+    
+    mood_key = Column(String, primary_key=True)  # Normalized mood text
+    genres = Column(String, nullable=False)  # Comma-separated genre IDs
+    explanation = Column(Text, nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    last_used_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    
+    def __repr__(self):
+        return f"<MoodCacheEntry(mood_key='{self.mood_key}')>"
+
+
+class CatalogMovie(Base):
+    """Model for movies mirrored locally from TMDB discover results"""
+    __tablename__ = "catalog_movies"
+    
+    movie_id = Column(Integer, primary_key=True)
+    title = Column(String, nullable=False)
+    overview = Column(Text)
+    poster_path = Column(String)
+    backdrop_path = Column(String)
+    vote_average = Column(Float)
+    vote_count = Column(Integer, nullable=False, default=0)
+    popularity = Column(Float, nullable=False, default=0.0)
+    release_date = Column(String)
+    genre_ids = Column(String, nullable=False)  # Comma-separated genre IDs
+    synced_at = Column(DateTime(timezone=True), nullable=False, default=utcnow)
+    
+    def __repr__(self):
+        return f"<CatalogMovie(movie_id={self.movie_id}, title='{self.title}')>"
+
+
+class CatalogMovieGenre(Base):
+    """Model indexing mirrored movies by genre and popularity"""
+    __tablename__ = "catalog_movie_genres"
+    __table_args__ = (
+        # Serves "movies in genre X by popularity" without touching other genres
+        Index("ix_catalog_movie_genres_genre_popularity", "genre_id", "popularity"),
+    )
+    
+    movie_id = Column(Integer, ForeignKey("catalog_movies.movie_id", ondelete="CASCADE"), primary_key=True)
+    genre_id = Column(Integer, primary_key=True)
+    popularity = Column(Float, nullable=False, default=0.0)  # Copied from CatalogMovie for the index
+    
+    def __repr__(self):
+        return f"<CatalogMovieGenre(movie_id={self.movie_id}, genre_id={self.genre_id})>"
+
+
+class CatalogSync(Base):
+    """Model recording which discover queries the local catalog can answer"""
+    __tablename__ = "catalog_sync"
+    
+    genres_key = Column(String, primary_key=True)  # Sorted, comma-separated genre IDs
+    pages_synced = Column(Integer, nullable=False)
+    total_pages = Column(Integer, nullable=False)  # As reported by TMDB, clamped to 500
+    total_results = Column(Integer, nullable=False)
+    synced_at = Column(DateTime(timezone=True), nullable=False, default=utcnow)
+    
+    def __repr__(self):
+        return f"<CatalogSync(genres_key='{self.genres_key}', pages_synced={self.pages_synced})>"
@@ -1,55 +1,315 @@
 """API routes for FavourFlix-AI"""
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+import base64
+import logging
+import math
+from datetime import datetime
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
+import orjson
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
-from typing import List
+from typing import Dict, List, Optional, Tuple
 
+from ..config import settings
 from ..database import get_db
+from ..http_cache import (
+    LIST_CACHE_CONTROL,
+    NO_STORE,
+    cached_response,
+    etag_matches,
+    make_etag,
+    recommend_etags,
+    request_key
+)
+from ..metrics import track_stage
 from ..schemas.schemas import (
     MoodRequest,
+    MovieBatchRequest,
+    MovieBatchResponse,
     RecommendationResponse,
     FavouriteCreate,
+    FavouriteImportResponse,
     FavouriteResponse,
-    HistoryResponse
+    HistoryResponse,
+    SearchStatsResponse
 )
 from ..models.models import Favourite, History
+from ..services.favourite_ids import favourite_ids
+from ..services.favourites_bulk import ImportTooLarge, export_favourites, import_favourites, parse_ndjson, read_limited
+from ..services.genre_fanout import InvalidCursor, decode_cursor as decode_fanout_cursor
+from ..services.mood_cache import normalize_mood
 from ..services.recommendation_service import RecommendationService
+from ..services.search_stats import top_searches
+from ..services.upstream import UpstreamError
+
+logger = logging.getLogger("uvicorn")
 
 router = APIRouter(prefix="/api", tags=["api"])
 
 
+def get_recommendation_service(request: Request) -> RecommendationService:
+    """Dependency for the recommendation service created at startup"""
+    return request.app.state.recommendation_service
+
+# Columns always returned by list endpoints and those that can be
+# requested with the `fields` query parameter
+FAVOURITE_LIST_COLUMNS = ("id", "movie_id", "title", "created_at")
+FAVOURITE_OPTIONAL_COLUMNS = ("overview", "poster_path", "backdrop_path", "vote_average", "release_date")
+HISTORY_LIST_COLUMNS = ("id", "mood", "genres", "created_at")
+HISTORY_OPTIONAL_COLUMNS = ("explanation",)
+
+
+def _upstream_unavailable(error: UpstreamError) -> HTTPException:
+    """Build a 503 telling the client when the upstream may be available again"""
+    headers = None
+    if error.retry_after is not None:
+        headers = {"Retry-After": str(max(1, math.ceil(error.retry_after)))}
+    return HTTPException(status_code=503, detail=str(error), headers=headers)
+
+
+def _encode_cursor(created_at: datetime, row_id: int) -> str:
+    """Encode a (created_at, id) position as an opaque cursor"""
+    raw = f"{created_at.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Decode a cursor produced by _encode_cursor"""
+    try:
+        created_at, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(row_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _list_columns(model, required: Tuple[str, ...], optional: Tuple[str, ...], fields: Optional[str]):
+    """Resolve the `fields` query parameter to the columns to select"""
+    if fields is None:
+        return [getattr(model, name) for name in required + optional]
+    
+    requested = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = requested - set(required) - set(optional)
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(sorted(unknown))}"
+        )
+    return [getattr(model, name) for name in required + optional if name in required or name in requested]
+
+
+async def _keyset_page(db: AsyncSession, model, columns, cursor: Optional[str], limit: int, response: Response):
+    """
+    Fetch one page of rows newest-first, keyed on (created_at, id)
+    
+    Sets the X-Next-Cursor header when more rows follow.
+    """
+    query = select(*columns).order_by(model.created_at.desc(), model.id.desc())
+    if cursor:
+        created_at, row_id = _decode_cursor(cursor)
+        query = query.where(tuple_(model.created_at, model.id) < tuple_(created_at, row_id))
+    
+    result = await db.execute(query.limit(limit + 1))
+    rows = result.mappings().all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = _encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+    return rows
+
+
+def _cacheable_page(schema, rows, response: Response, if_none_match: Optional[str]) -> Response:
+    """
+    Serialize a list page with an ETag of its content
+    
+    Answers 304 when If-None-Match already names it, and carries over the
+    X-Next-Cursor header set by _keyset_page.
+    """
+    body = orjson.dumps([
+        schema.model_validate(dict(row)).model_dump(mode="json", exclude_unset=True)
+        for row in rows
+    ])
+    headers = {}
+    if "X-Next-Cursor" in response.headers:
+        headers["X-Next-Cursor"] = response.headers["X-Next-Cursor"]
+    return cached_response(body, make_etag(body), LIST_CACHE_CONTROL, if_none_match, headers)
+
+
+def _check_fanout_cursor(cursor: Optional[str]) -> None:
+    """Reject a malformed recommendation cursor before any upstream call"""
+    if cursor:
+        try:
+            decode_fanout_cursor(cursor)
+        except InvalidCursor:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def _recommend(
+    recommendation_service: RecommendationService,
+    mood: str,
+    page: int,
+    cursor: Optional[str],
+    exclude_favourites: bool
+) -> Dict:
+    """Run a recommendation, mapping failures to HTTP errors"""
+    try:
+        return await recommendation_service.get_recommendations(
+            mood=mood,
+            page=page,
+            cursor=cursor,
+            exclude_favourites=exclude_favourites
+        )
+    except UpstreamError as e:
+        raise _upstream_unavailable(e)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to get recommendations: {str(e)}"
+        )
+
+
 @router.post("/recommend", response_model=RecommendationResponse)
 async def get_recommendations(
     request: MoodRequest,
     page: int = Query(1, ge=1, le=500, description="Page number"),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page (multi-genre fan-out)"),
+    exclude_favourites: bool = Query(False, description="Leave out movies that are already favourites"),
+    recommendation_service: RecommendationService = Depends(get_recommendation_service)
 ):
     """
     Get movie recommendations based on mood
     
     - Converts mood to genres using Gemini AI
     - Fetches movies from TMDB with pagination
-    - Returns explanation and movie list
+    - Returns explanation and movie list, each movie flagged with is_favourite
+    - Responds 503 with Retry-After when TMDB is unavailable or over quota
+    - With multi-genre fan-out, pass next_cursor back as `cursor` for a
+      stable next page
+    """
+    _check_fanout_cursor(cursor)
+    result = await _recommend(recommendation_service, request.mood, page, cursor, exclude_favourites)
+    # Built from trusted TMDB data: serialize directly rather than
+    # validating again against RecommendationResponse, which only
+    # documents the payload here
+    with track_stage("serialize"):
+        return ORJSONResponse(result)
+
+
+@router.get("/recommend", response_model=RecommendationResponse)
+async def get_recommendations_cacheable(
+    mood: str = Query(..., min_length=1, max_length=500, description="User's mood or situation"),
+    page: int = Query(1, ge=1, le=500, description="Page number"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page (multi-genre fan-out)"),
+    exclude_favourites: bool = Query(False, description="Leave out movies that are already favourites"),
+    if_none_match: Optional[str] = Header(None),
+    recommendation_service: RecommendationService = Depends(get_recommendation_service)
+):
     """
+    Get movie recommendations based on mood, cacheable by HTTP caches
+    
+    - Same results as POST /recommend, with the mood in the query string
+    - Sends an ETag; Cache-Control is no-cache unless RECOMMEND_CACHE_MAX_AGE
+      allows reuse without revalidating
+    - Answers If-None-Match with 304 from remembered ETags, without
+      calling Gemini or TMDB, once the database confirms the favourite
+      flags are unchanged
+    - Results built from fallback genres are sent with Cache-Control: no-store
+    """
+    _check_fanout_cursor(cursor)
+    key = request_key(normalize_mood(mood), page, cursor, exclude_favourites)
+    cache_control = LIST_CACHE_CONTROL
+    if settings.RECOMMEND_CACHE_MAX_AGE:
+        cache_control = f"private, max-age={settings.RECOMMEND_CACHE_MAX_AGE}"
+    known = recommend_etags.get(key)
+    if known is not None and etag_matches(if_none_match, known["etag"]):
+        # Favourites are shared by every worker, so the flags are checked
+        # against the database rather than this worker's favourite set
+        try:
+            if await favourite_ids.query(known["movie_ids"]) == known["favourites"]:
+                return Response(status_code=304, headers={"ETag": known["etag"], "Cache-Control": cache_control})
+        except Exception as e:
+            logger.warning(f"ETag revalidation failed, recomputing: {type(e).__name__}: {str(e)}")
+    
+    result = await _recommend(recommendation_service, mood, page, cursor, exclude_favourites=False)
+    movie_ids = [movie["id"] for movie in result["movies"]]
     try:
-        recommendation_service = RecommendationService()
-        result = await recommendation_service.get_recommendations(
-            mood=request.mood,
-            page=page,
-            db=db
-        )
-        return result
+        favourites = await favourite_ids.query(movie_ids)
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Failed to get recommendations: {str(e)}"
         )
+    for movie in result["movies"]:
+        movie["is_favourite"] = movie["id"] in favourites
+    if exclude_favourites:
+        result["movies"] = [movie for movie in result["movies"] if not movie["is_favourite"]]
+    
+    with track_stage("serialize"):
+        body = orjson.dumps(result)
+        etag = make_etag(orjson.dumps({**result, "source": None}))
+    if result["source"] == "fallback":
+        return cached_response(body, etag, NO_STORE, None)
+    recommend_etags.set(key, {"etag": etag, "movie_ids": movie_ids, "favourites": favourites})
+    return cached_response(body, etag, cache_control, if_none_match)
+
+
+@router.post("/recommend/stream")
+async def stream_recommendations(
+    request: MoodRequest,
+    page: int = Query(1, ge=1, le=500, description="Page number"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page (multi-genre fan-out)"),
+    exclude_favourites: bool = Query(False, description="Leave out movies that are already favourites"),
+    recommendation_service: RecommendationService = Depends(get_recommendation_service)
+):
+    """
+    Get movie recommendations as newline-delimited JSON events
+    
+    - `genres` as soon as the mood is resolved
+    - `explanation` pieces as Gemini writes them
+    - `movies` as soon as TMDB answers, often before the explanation ends
+    - `done` with the full explanation, or `error` if something failed
+    """
+    _check_fanout_cursor(cursor)
+    
+    async def lines():
+        async for event in recommendation_service.stream_recommendations(
+            mood=request.mood,
+            page=page,
+            cursor=cursor,
+            exclude_favourites=exclude_favourites
+        ):
+            yield orjson.dumps(event) + b"\n"
+    
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.post("/movies/batch", response_model=MovieBatchResponse)
+async def get_movie_details_batch(
+    request: MovieBatchRequest,
+    recommendation_service: RecommendationService = Depends(get_recommendation_service)
+):
+    """
+    Get details for several movies in one request
+    
+    - Fetches uncached movies from TMDB concurrently
+    - Returns details in request order, duplicates removed
+    - Movies that could not be fetched are listed in `errors`
+    """
+    if len(set(request.ids)) > settings.TMDB_DETAILS_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.TMDB_DETAILS_BATCH_MAX_SIZE} movie IDs can be requested at once"
+        )
+    return await recommendation_service.tmdb_service.get_movie_details_many(request.ids)
 
 
 @router.post("/favourites", response_model=FavouriteResponse)
 async def add_favourite(
     favourite: FavouriteCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Add a movie to favourites
@@ -68,34 +328,121 @@ async def add_favourite(
             release_date=favourite.release_date
         )
         db.add(db_favourite)
-        db.commit()
-        db.refresh(db_favourite)
+        await db.commit()
+        favourite_ids.add(db_favourite.movie_id)
+        await db.refresh(db_favourite)
         return db_favourite
     except IntegrityError:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=400,
             detail="This movie is already in your favourites"
         )
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=500,
             detail=f"Failed to add favourite: {str(e)}"
         )
 
 
-@router.get("/favourites", response_model=List[FavouriteResponse])
-async def get_favourites(db: Session = Depends(get_db)):
+@router.post("/favourites/import", response_model=FavouriteImportResponse)
+async def import_favourites_bulk(
+    request: Request,
+    on_conflict: str = Query("ignore", pattern="^(ignore|update)$", description="ignore or update favourites that already exist"),
+):
+    """
+    Add many favourites in one request
+    
+    - Body: a JSON array of favourites, or NDJSON (one favourite per line)
+      with Content-Type application/x-ndjson, parsed and validated as it
+      arrives
+    - Written in chunks, each with a single INSERT ... ON CONFLICT, once
+      the whole body has been read
+    - More than FAVOURITES_IMPORT_MAX_ITEMS items or
+      FAVOURITES_IMPORT_MAX_BYTES bytes: 413, nothing written (an
+      oversized Content-Length is rejected before the body is read)
+    - Reports each item's outcome: created, updated, unchanged, duplicate,
+      invalid or failed
+    """
+    max_bytes = settings.FAVOURITES_IMPORT_MAX_BYTES
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > max_bytes:
+        raise HTTPException(status_code=413, detail=f"Import body is limited to {max_bytes} bytes")
+    body_chunks = read_limited(request.stream(), max_bytes)
+    
+    content_type = request.headers.get("content-type", "")
+    try:
+        if "ndjson" in content_type or "jsonl" in content_type:
+            items = parse_ndjson(body_chunks)
+        else:
+            try:
+                body = orjson.loads(b"".join([chunk async for chunk in body_chunks]))
+            except orjson.JSONDecodeError:
+                raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+            if not isinstance(body, list):
+                raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+            items = _iterate(body)
+        return await import_favourites(items, update_existing=on_conflict == "update")
+    except HTTPException:
+        raise
+    except ImportTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to import favourites: {str(e)}"
+        )
+
+
+async def _iterate(items: list):
+    """Wrap a parsed JSON array for import_favourites"""
+    for item in items:
+        yield item
+
+
+@router.get("/favourites/export")
+async def export_favourites_stream():
+    """
+    Export every favourite as NDJSON, oldest first
+    
+    - Streamed from a server-side cursor, without loading the table
+    - The output can be posted back to /api/favourites/import
+    """
+    return StreamingResponse(
+        export_favourites(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="favourites.ndjson"'}
+    )
+
+
+@router.get(
+    "/favourites",
+    response_model=List[FavouriteResponse],
+    response_model_exclude_unset=True
+)
+async def get_favourites(
+    response: Response,
+    limit: int = Query(100, ge=1, le=500, description="Maximum number of favourites"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+    fields: Optional[str] = Query(None, description="Comma-separated optional fields to include (default: all)"),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db)
+):
     """
-    Get all favourite movies
+    Get favourite movies
     
-    - Returns list of all saved favourites
+    - Returns a page of saved favourites
     - Ordered by most recently added
+    - X-Next-Cursor header points at the next page when there is one
+    - ETag of the page; If-None-Match answered with 304 when unchanged
     """
+    columns = _list_columns(Favourite, FAVOURITE_LIST_COLUMNS, FAVOURITE_OPTIONAL_COLUMNS, fields)
     try:
-        favourites = db.query(Favourite).order_by(Favourite.created_at.desc()).all()
-        return favourites
+        rows = await _keyset_page(db, Favourite, columns, cursor, limit, response)
+        return _cacheable_page(FavouriteResponse, rows, response, if_none_match)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -106,7 +453,7 @@ async def get_favourites(db: Session = Depends(get_db)):
 @router.delete("/favourites/{movie_id}")
 async def remove_favourite(
     movie_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Remove a movie from favourites
@@ -114,39 +461,75 @@ async def remove_favourite(
     - Deletes favourite by movie_id
     """
     try:
-        favourite = db.query(Favourite).filter(Favourite.movie_id == movie_id).first()
+        result = await db.execute(select(Favourite).where(Favourite.movie_id == movie_id))
+        favourite = result.scalars().first()
         if not favourite:
             raise HTTPException(status_code=404, detail="Favourite not found")
         
-        db.delete(favourite)
-        db.commit()
+        await db.delete(favourite)
+        await db.commit()
+        favourite_ids.discard(movie_id)
         return {"message": "Favourite removed successfully"}
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=500,
             detail=f"Failed to remove favourite: {str(e)}"
         )
 
 
-@router.get("/history", response_model=List[HistoryResponse])
+@router.get(
+    "/history",
+    response_model=List[HistoryResponse],
+    response_model_exclude_unset=True
+)
 async def get_history(
+    response: Response,
     limit: int = Query(20, ge=1, le=100, description="Maximum number of history entries"),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+    fields: Optional[str] = Query(None, description="Comma-separated optional fields to include (default: all)"),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Get mood search history
     
     - Returns list of past searches with AI explanations
     - Ordered by most recent
+    - X-Next-Cursor header points at the next page when there is one
+    - ETag of the page; If-None-Match answered with 304 when unchanged
     """
+    columns = _list_columns(History, HISTORY_LIST_COLUMNS, HISTORY_OPTIONAL_COLUMNS, fields)
     try:
-        history = db.query(History).order_by(History.created_at.desc()).limit(limit).all()
-        return history
+        rows = await _keyset_page(db, History, columns, cursor, limit, response)
+        return _cacheable_page(HistoryResponse, rows, response, if_none_match)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Failed to fetch history: {str(e)}"
         )
+
+
+@router.get("/stats", response_model=SearchStatsResponse)
+async def get_stats(
+    hours: int = Query(24 * 7, ge=1, le=24 * 366, description="Window length in hours, ending now"),
+    limit: int = Query(10, ge=1, le=100, description="Maximum genres and moods to return")
+):
+    """
+    Get the most searched genres and moods
+    
+    - Counts searches over the last `hours` hours (from the start of the first hour)
+    - Read from hourly and daily rollups, not from the history table
+    - Moods are counted by their normalized text
+    """
+    try:
+        return await top_searches(hours, limit)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to fetch stats: {str(e)}"
+        )
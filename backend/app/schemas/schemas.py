@@ -21,6 +21,11 @@ class FavouriteCreate(BaseModel):
     release_date: Optional[str] = None
 
 
+class MovieBatchRequest(BaseModel):
+    """Request schema for fetching details of several movies"""
+    ids: List[int] = Field(..., min_length=1, description="TMDB movie IDs")
+
+
 # Response Schemas
 class Movie(BaseModel):
     """Schema for movie data from TMDB"""
@@ -34,13 +39,48 @@ class Movie(BaseModel):
     genre_ids: Optional[List[int]] = []
 
 
+class Genre(BaseModel):
+    """Schema for a TMDB genre"""
+    id: int
+    name: str
+
+
+class RecommendedMovie(Movie):
+    """Schema for a recommended movie"""
+    is_favourite: bool = False
+
+
+class MovieDetails(Movie):
+    """Schema for detailed movie data from TMDB"""
+    tagline: Optional[str] = None
+    runtime: Optional[int] = None
+    status: Optional[str] = None
+    vote_count: Optional[int] = None
+    imdb_id: Optional[str] = None
+    genres: List[Genre] = []
+
+
+class MovieDetailsError(BaseModel):
+    """Schema for a movie whose details could not be fetched"""
+    id: int
+    error: str = Field(..., description="not_found, http_<status> or the error type")
+
+
+class MovieBatchResponse(BaseModel):
+    """Response schema for batched movie details"""
+    movies: List[MovieDetails]
+    errors: List[MovieDetailsError]
+
+
 class RecommendationResponse(BaseModel):
     """Response schema for movie recommendations"""
     explanation: str
     page: int
     total_pages: int
     total_results: int
-    movies: List[Movie]
+    movies: List[RecommendedMovie]
+    source: Optional[str] = Field(None, description="What resolved the mood: cache, similar, classifier, gemini or fallback")
+    next_cursor: Optional[str] = Field(None, description="Cursor for the next page of a multi-genre fan-out, if any")
 
 
 class FavouriteResponse(BaseModel):
@@ -59,18 +99,59 @@ class FavouriteResponse(BaseModel):
         from_attributes = True
 
 
+class FavouriteImportItem(BaseModel):
+    """Outcome of one item in a favourites import"""
+    index: int
+    movie_id: Optional[int] = None
+    status: str = Field(..., description="created, updated, unchanged, duplicate, invalid or failed")
+    error: Optional[str] = None
+
+
+class FavouriteImportResponse(BaseModel):
+    """Response schema for a favourites import"""
+    created: int
+    updated: int
+    unchanged: int
+    duplicate: int
+    invalid: int
+    failed: int
+    items: List[FavouriteImportItem]
+
+
 class HistoryResponse(BaseModel):
     """Response schema for search history"""
     id: int
     mood: str
     genres: str
-    explanation: str
+    explanation: Optional[str] = None
     created_at: datetime
     
     class Config:
         from_attributes = True
 
 
+class GenreStat(BaseModel):
+    """Search count of one genre"""
+    genre_id: int
+    name: Optional[str] = None
+    searches: int
+
+
+class MoodStat(BaseModel):
+    """Search count of one normalized mood"""
+    mood: str
+    searches: int
+
+
+class SearchStatsResponse(BaseModel):
+    """Response schema for search statistics over a time window"""
+    hours: int
+    since: datetime
+    until: datetime
+    genres: List[GenreStat]
+    moods: List[MoodStat]
+
+
 class GenreMapping(BaseModel):
     """Schema for genre mapping from Gemini API"""
     genre_ids: List[int]
@@ -0,0 +1,304 @@
+"""Local mirror of TMDB discover results indexed by genre and popularity"""
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, exists, func, select
+
+from .cache import TTLCache
+from ..config import settings
+from ..database import SessionLocal, dialect_insert
+from ..models.models import CatalogMovie, CatalogMovieGenre, CatalogSync, History
+
+logger = logging.getLogger("uvicorn")
+
+# Results per page, matching TMDB's discover endpoint
+PAGE_SIZE = 20
+# Minimum vote count applied by TMDBService.discover_movies
+MIN_VOTE_COUNT = 100
+
+
+def genres_key(genre_ids: List[int]) -> str:
+    """Normalize genre IDs into the key a discover query is synced under"""
+    return ",".join(map(str, sorted(set(genre_ids))))
+
+
+class CatalogService:
+    """
+    Answers popularity-sorted discover queries from locally mirrored pages
+
+    A query is served locally only when its exact genre combination has
+    been synced within CATALOG_MAX_AGE and the page lies within the synced
+    depth, so results and totals match what TMDB returned at sync time.
+    """
+
+    def __init__(self, max_age: float):
+        """
+        Args:
+            max_age: Seconds a synced query stays fresh enough to serve
+        """
+        self.max_age = max_age
+        # Sync records are read on every discover call, so keep them briefly
+        self._sync_rows = TTLCache(maxsize=1024, ttl=60)
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+
+    async def discover(self, genre_ids: List[int], page: int, allow_stale: bool = False) -> Optional[Dict]:
+        """
+        Serve a discover page from the mirror
+
+        Args:
+            genre_ids: List of TMDB genre IDs (AND semantics, like with_genres)
+            page: Page number
+            allow_stale: Serve even if the sync is older than max_age,
+                used when TMDB itself is unavailable
+
+        Returns:
+            Dict shaped like TMDBService.discover_movies, or None when the
+            mirror cannot answer the query
+        """
+        key = genres_key(genre_ids)
+        sync = await self._get_sync(key)
+        if sync is None or page > sync["pages_synced"]:
+            self.misses += 1
+            return None
+
+        age = (datetime.now(timezone.utc) - sync["synced_at"]).total_seconds()
+        if age > self.max_age and not allow_stale:
+            self.misses += 1
+            return None
+
+        results = await self._query_page(sorted(set(genre_ids)), page, sync["synced_at"])
+        if age > self.max_age:
+            self.stale_hits += 1
+        else:
+            self.hits += 1
+        return {
+            "results": results,
+            "page": page,
+            "total_pages": sync["total_pages"],
+            "total_results": sync["total_results"]
+        }
+
+    def stats(self) -> Dict:
+        """Return lookup counters"""
+        return {"hits": self.hits, "stale_hits": self.stale_hits, "misses": self.misses}
+
+    async def _get_sync(self, key: str) -> Optional[Dict]:
+        """Load the sync record for a genre key, cached briefly in memory"""
+        sync = self._sync_rows.get(key)
+        if sync is not None:
+            return sync or None
+
+        async with SessionLocal() as db:
+            row = await db.get(CatalogSync, key)
+        if row is None:
+            # Remember misses too so unsynced keys don't hit the database
+            self._sync_rows.set(key, {})
+            return None
+
+        synced_at = row.synced_at
+        if synced_at.tzinfo is None:
+            synced_at = synced_at.replace(tzinfo=timezone.utc)
+        sync = {
+            "pages_synced": row.pages_synced,
+            "total_pages": row.total_pages,
+            "total_results": row.total_results,
+            "synced_at": synced_at
+        }
+        self._sync_rows.set(key, sync)
+        return sync
+
+    async def _query_page(self, genre_ids: List[int], page: int, synced_since: datetime) -> List[Dict]:
+        """
+        Select one page of movies having every genre, most popular first
+
+        Only movies stored since the combination's last sync started are
+        considered. Movies that have dropped out of TMDB's list keep the
+        popularity they had when last stored, so they would otherwise
+        outrank the current list.
+        """
+        first, rest = genre_ids[0], genre_ids[1:]
+        query = (
+            select(CatalogMovie)
+            .join(CatalogMovieGenre, CatalogMovieGenre.movie_id == CatalogMovie.movie_id)
+            .where(CatalogMovieGenre.genre_id == first)
+            .where(CatalogMovie.vote_count >= MIN_VOTE_COUNT)
+            .where(CatalogMovie.synced_at >= synced_since)
+        )
+        for genre_id in rest:
+            query = query.where(exists().where(
+                CatalogMovieGenre.movie_id == CatalogMovie.movie_id,
+                CatalogMovieGenre.genre_id == genre_id
+            ).correlate(CatalogMovie))
+        query = (
+            query.order_by(CatalogMovieGenre.popularity.desc(), CatalogMovie.movie_id)
+            .offset((page - 1) * PAGE_SIZE)
+            .limit(PAGE_SIZE)
+        )
+
+        async with SessionLocal() as db:
+            movies = (await db.execute(query)).scalars().all()
+        return [
+            {
+                "id": movie.movie_id,
+                "title": movie.title,
+                "overview": movie.overview,
+                "poster_path": movie.poster_path,
+                "backdrop_path": movie.backdrop_path,
+                "vote_average": movie.vote_average,
+                "vote_count": movie.vote_count,
+                "popularity": movie.popularity,
+                "release_date": movie.release_date,
+                "genre_ids": [int(g) for g in movie.genre_ids.split(",") if g]
+            }
+            for movie in movies
+        ]
+
+    async def sync(self, tmdb_service, genre_combinations: List[List[int]], pages: int) -> None:
+        """
+        Ingest popularity-sorted discover pages for each genre combination
+
+        Args:
+            tmdb_service: TMDBService used to fetch pages from the network
+            genre_combinations: Genre ID lists to mirror
+            pages: Maximum pages to ingest per combination
+        """
+        for genre_ids in genre_combinations:
+            key = genres_key(genre_ids)
+            # Recorded as the sync time, so pages served afterwards only
+            # use movies this sync (or a later one) stored
+            started_at = datetime.now(timezone.utc)
+            pages_synced = 0
+            total_pages = 1
+            total_results = 0
+            page = 1
+            while page <= min(pages, total_pages):
+                try:
+                    data = await tmdb_service.fetch_discover(sorted(set(genre_ids)), page)
+                except Exception as e:
+                    logger.error(f"Catalog sync failed for genres {key} page {page}: {type(e).__name__}: {str(e)}")
+                    break
+                total_pages = min(data.get("total_pages", 1), 500)
+                total_results = data.get("total_results", 0)
+                await self._store_movies(data.get("results", []))
+                pages_synced = page
+                page += 1
+
+            if pages_synced:
+                await self._store_sync(key, pages_synced, total_pages, total_results, started_at)
+                logger.info(f"Catalog synced genres {key}: {pages_synced}/{total_pages} pages")
+        self._sync_rows.clear()
+
+    async def _store_movies(self, results: List[Dict]) -> None:
+        """Upsert a page of movies and refresh their genre index rows"""
+        if not results:
+            return
+        now = datetime.now(timezone.utc)
+        movies = [
+            {
+                "movie_id": movie["id"],
+                "title": movie.get("title", ""),
+                "overview": movie.get("overview"),
+                "poster_path": movie.get("poster_path"),
+                "backdrop_path": movie.get("backdrop_path"),
+                "vote_average": movie.get("vote_average"),
+                "vote_count": movie.get("vote_count", 0),
+                "popularity": movie.get("popularity", 0.0),
+                "release_date": movie.get("release_date"),
+                "genre_ids": ",".join(map(str, movie.get("genre_ids", []))),
+                "synced_at": now
+            }
+            for movie in results
+        ]
+        genres = [
+            {"movie_id": movie["id"], "genre_id": genre_id, "popularity": movie.get("popularity", 0.0)}
+            for movie in results
+            for genre_id in set(movie.get("genre_ids", []))
+        ]
+
+        insert_movies = dialect_insert(CatalogMovie.__table__).values(movies)
+        insert_movies = insert_movies.on_conflict_do_update(
+            index_elements=["movie_id"],
+            set_={
+                column: insert_movies.excluded[column]
+                for column in movies[0]
+                if column != "movie_id"
+            }
+        )
+        async with SessionLocal() as db:
+            await db.execute(insert_movies)
+            await db.execute(delete(CatalogMovieGenre).where(
+                CatalogMovieGenre.movie_id.in_([movie["movie_id"] for movie in movies])
+            ))
+            if genres:
+                await db.execute(dialect_insert(CatalogMovieGenre.__table__).values(genres))
+            await db.commit()
+
+    async def _store_sync(
+        self,
+        key: str,
+        pages_synced: int,
+        total_pages: int,
+        total_results: int,
+        synced_at: datetime
+    ) -> None:
+        """Record how far a genre combination was synced, and when the sync started"""
+        async with SessionLocal() as db:
+            await db.merge(CatalogSync(
+                genres_key=key,
+                pages_synced=pages_synced,
+                total_pages=total_pages,
+                total_results=total_results,
+                synced_at=synced_at
+            ))
+            await db.commit()
+
+    @staticmethod
+    async def popular_genre_combinations(limit: int) -> List[List[int]]:
+        """Return the multi-genre combinations searched most often"""
+        if limit <= 0:
+            return []
+        query = (
+            select(History.genres, func.count().label("searches"))
+            .where(History.genres.contains(","))
+            .group_by(History.genres)
+            .order_by(func.count().desc())
+            .limit(limit)
+        )
+        async with SessionLocal() as db:
+            rows = (await db.execute(query)).all()
+
+        combinations: Dict[str, List[int]] = {}
+        for genres, _ in rows:
+            genre_ids = [int(g) for g in genres.split(",") if g]
+            combinations.setdefault(genres_key(genre_ids), genre_ids)
+        return list(combinations.values())
+
+
+# Process-wide catalog mirror
+catalog = CatalogService(max_age=settings.CATALOG_MAX_AGE)
+
+
+async def run_sync() -> None:
+    """Sync every single genre plus the most searched genre combinations"""
+    from .gemini_service import GeminiService
+    from .tmdb_service import TMDBService
+    from ..database import engine, init_db
+
+    await init_db()
+    tmdb_service = TMDBService()
+    try:
+        combinations = [[genre_id] for genre_id in sorted(set(GeminiService.GENRE_MAP.values()))]
+        combinations += await catalog.popular_genre_combinations(settings.CATALOG_SYNC_TOP_COMBINATIONS)
+        await catalog.sync(tmdb_service, combinations, settings.CATALOG_SYNC_PAGES)
+    finally:
+        await tmdb_service.close_client()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    import asyncio
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_sync())
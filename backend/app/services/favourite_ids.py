@@ -0,0 +1,126 @@
+"""In-process set of favourited movie IDs for annotating recommendations"""
+import asyncio
+import logging
+import time
+from typing import Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import select
+
+from ..config import settings
+from ..database import SessionLocal
+from ..models.models import Favourite
+
+logger = logging.getLogger("uvicorn")
+
+
+class FavouriteIds:
+    """
+    Answers "which of these movies are favourites?" without a query
+
+    The IDs are loaded at startup and updated by the favourite routes, so
+    this process always sees its own changes. Other workers' changes show
+    up once the set is reloaded, at most every `max_age` seconds. Until
+    the set has loaded (or if loading failed), lookups fall back to one
+    IN query per call.
+    """
+
+    def __init__(self, max_age: float):
+        """
+        Args:
+            max_age: Seconds before the set is reloaded in the background
+                (0 to never reload)
+        """
+        self.max_age = max_age
+        self._ids: Optional[Set[int]] = None
+        self._loaded_at = 0.0
+        # Changes made while a reload is reading the table, replayed on
+        # top of its result so they are not lost
+        self._changes: Optional[List[Tuple[bool, int]]] = None
+        self._reload_task: Optional[asyncio.Task] = None
+        self.fallback_queries = 0
+
+    async def load(self) -> None:
+        """Load every favourited movie ID from the database"""
+        self._changes = []
+        try:
+            async with SessionLocal() as db:
+                ids = set((await db.execute(select(Favourite.movie_id))).scalars())
+        except Exception as e:
+            logger.error(f"Favourite IDs load error: {type(e).__name__}: {str(e)}")
+            return
+        finally:
+            changes, self._changes = self._changes, None
+
+        for added, movie_id in changes:
+            if added:
+                ids.add(movie_id)
+            else:
+                ids.discard(movie_id)
+        self._ids = ids
+        self._loaded_at = time.monotonic()
+
+    async def close(self) -> None:
+        """Stop a background reload"""
+        if self._reload_task is not None:
+            self._reload_task.cancel()
+            await asyncio.gather(self._reload_task, return_exceptions=True)
+
+    def add(self, *movie_ids: int) -> None:
+        """Record movies that were just favourited"""
+        for movie_id in movie_ids:
+            if self._changes is not None:
+                self._changes.append((True, movie_id))
+            if self._ids is not None:
+                self._ids.add(movie_id)
+
+    def discard(self, *movie_ids: int) -> None:
+        """Record movies that were just removed from favourites"""
+        for movie_id in movie_ids:
+            if self._changes is not None:
+                self._changes.append((False, movie_id))
+            if self._ids is not None:
+                self._ids.discard(movie_id)
+
+    async def find(self, movie_ids: Iterable[int]) -> Set[int]:
+        """
+        Return which of the given movies are favourites
+
+        Raises:
+            SQLAlchemyError: The set is not loaded and the fallback query failed
+        """
+        movie_ids = set(movie_ids)
+        if not movie_ids:
+            return set()
+        if self._ids is None:
+            return await self._query(movie_ids)
+
+        stale = self.max_age and time.monotonic() - self._loaded_at > self.max_age
+        if stale and (self._reload_task is None or self._reload_task.done()):
+            self._reload_task = asyncio.create_task(self.load())
+        return movie_ids & self._ids
+
+    async def _query(self, movie_ids: Set[int]) -> Set[int]:
+        """Look the movies up with a single IN query"""
+        self.fallback_queries += 1
+        return await self.query(movie_ids)
+
+    @staticmethod
+    async def query(movie_ids: Iterable[int]) -> Set[int]:
+        """
+        Return which of the given movies are favourites, from the database
+
+        Unlike find(), this sees other workers' changes immediately.
+
+        Raises:
+            SQLAlchemyError: The query failed
+        """
+        movie_ids = set(movie_ids)
+        if not movie_ids:
+            return set()
+        async with SessionLocal() as db:
+            result = await db.execute(select(Favourite.movie_id).where(Favourite.movie_id.in_(movie_ids)))
+            return set(result.scalars())
+
+
+# Process-wide favourite ID set
+favourite_ids = FavouriteIds(max_age=settings.FAVOURITE_IDS_MAX_AGE)
@@ -0,0 +1,193 @@
+"""Bulk import and streaming export of favourites"""
+import logging
+from typing import Any, AsyncIterator, Dict, List, Tuple
+
+import orjson
+from pydantic import ValidationError
+from sqlalchemy import select
+
+from .favourite_ids import favourite_ids
+from ..config import settings
+from ..database import SessionLocal, dialect_insert
+from ..models.models import Favourite
+from ..schemas.schemas import FavouriteCreate
+
+logger = logging.getLogger("uvicorn")
+
+# Favourite columns written by an import and streamed by an export
+FAVOURITE_FIELDS = tuple(FavouriteCreate.model_fields)
+# Import outcome of each item
+OUTCOMES = ("created", "updated", "unchanged", "duplicate", "invalid", "failed")
+
+
+class ImportTooLarge(ValueError):
+    """Raised when an import exceeds FAVOURITES_IMPORT_MAX_ITEMS or FAVOURITES_IMPORT_MAX_BYTES"""
+
+
+async def read_limited(chunks: AsyncIterator[bytes], max_bytes: int) -> AsyncIterator[bytes]:
+    """
+    Pass a request body through, stopping once it exceeds max_bytes
+
+    Raises:
+        ImportTooLarge: The body is larger than max_bytes
+    """
+    received = 0
+    async for chunk in chunks:
+        received += len(chunk)
+        if received > max_bytes:
+            raise ImportTooLarge(f"Import body is limited to {max_bytes} bytes")
+        yield chunk
+
+
+async def parse_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[Any]:
+    """
+    Parse newline-delimited JSON as it arrives
+
+    Yields:
+        Each line's value, or the ValueError raised parsing it
+    """
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield _loads(line)
+    if buffer.strip():
+        yield _loads(buffer)
+
+
+def _loads(line: bytes) -> Any:
+    """Parse one JSON value, returning the error instead of raising it"""
+    try:
+        return orjson.loads(line)
+    except orjson.JSONDecodeError as e:
+        return ValueError(f"Invalid JSON: {e}")
+
+
+async def import_favourites(items: AsyncIterator[Any], update_existing: bool) -> Dict:
+    """
+    Upsert favourites in chunks, one INSERT ... ON CONFLICT per chunk
+
+    Args:
+        items: Favourite dicts (or the ValueError from parsing one)
+        update_existing: Overwrite favourites that already exist (DO
+            UPDATE) instead of leaving them unchanged (DO NOTHING)
+
+    Returns:
+        Dict with a count per outcome and an `items` list holding each
+        item's index, movie_id, status and, for failures, error
+
+    Raises:
+        ImportTooLarge: More than FAVOURITES_IMPORT_MAX_ITEMS items (or an
+            oversized body from read_limited), raised before anything is
+            written
+    """
+    # Items are validated as they arrive, but only written once every item
+    # has been read, so an oversized import is rejected as a whole instead
+    # of after some chunks committed
+    results: List[Dict] = []
+    pending: List[Tuple[int, FavouriteCreate]] = []
+    seen = set()
+    received = 0
+    async for item in items:
+        if received >= settings.FAVOURITES_IMPORT_MAX_ITEMS:
+            raise ImportTooLarge(f"Import is limited to {settings.FAVOURITES_IMPORT_MAX_ITEMS} items")
+        index = received
+        received += 1
+        if isinstance(item, ValueError):
+            results.append({"index": index, "movie_id": None, "status": "invalid", "error": str(item)})
+            continue
+        try:
+            favourite = FavouriteCreate.model_validate(item)
+        except ValidationError as e:
+            movie_id = item.get("movie_id") if isinstance(item, dict) else None
+            results.append({
+                "index": index,
+                "movie_id": movie_id if isinstance(movie_id, int) else None,
+                "status": "invalid",
+                "error": "; ".join(_describe(error) for error in e.errors())
+            })
+            continue
+        # A movie listed twice is imported once, from its first entry
+        if favourite.movie_id in seen:
+            results.append({"index": index, "movie_id": favourite.movie_id, "status": "duplicate"})
+            continue
+        seen.add(favourite.movie_id)
+        pending.append((index, favourite))
+
+    chunk_size = settings.FAVOURITES_IMPORT_CHUNK_SIZE
+    for start in range(0, len(pending), chunk_size):
+        results += await _upsert_chunk(pending[start:start + chunk_size], update_existing)
+
+    results.sort(key=lambda result: result["index"])
+    counts = {outcome: 0 for outcome in OUTCOMES}
+    for result in results:
+        counts[result["status"]] += 1
+    logger.info(f"Favourites import: {received} items, " + ", ".join(f"{k}={v}" for k, v in counts.items() if v))
+    return {**counts, "items": results}
+
+
+def _describe(error: Dict) -> str:
+    """Format a pydantic error as field: message"""
+    location = ".".join(map(str, error["loc"]))
+    return f"{location}: {error['msg']}" if location else error["msg"]
+
+
+async def _upsert_chunk(chunk: List[Tuple[int, FavouriteCreate]], update_existing: bool) -> List[Dict]:
+    """Write one chunk in a single statement and transaction"""
+    movie_ids = [favourite.movie_id for _, favourite in chunk]
+    rows = [favourite.model_dump() for _, favourite in chunk]
+    statement = dialect_insert(Favourite.__table__).values(rows)
+    if update_existing:
+        statement = statement.on_conflict_do_update(
+            index_elements=["movie_id"],
+            set_={field: statement.excluded[field] for field in FAVOURITE_FIELDS if field != "movie_id"}
+        )
+    else:
+        statement = statement.on_conflict_do_nothing(index_elements=["movie_id"])
+
+    try:
+        async with SessionLocal() as db:
+            existing = set((await db.execute(
+                select(Favourite.movie_id).where(Favourite.movie_id.in_(movie_ids))
+            )).scalars())
+            await db.execute(statement)
+            await db.commit()
+    except Exception as e:
+        logger.error(f"Favourites import chunk failed: {type(e).__name__}: {str(e)}")
+        return [
+            {"index": index, "movie_id": favourite.movie_id, "status": "failed", "error": type(e).__name__}
+            for index, favourite in chunk
+        ]
+
+    favourite_ids.add(*movie_ids)
+    existing_status = "updated" if update_existing else "unchanged"
+    return [
+        {
+            "index": index,
+            "movie_id": favourite.movie_id,
+            "status": existing_status if favourite.movie_id in existing else "created"
+        }
+        for index, favourite in chunk
+    ]
+
+
+async def export_favourites() -> AsyncIterator[bytes]:
+    """
+    Stream every favourite as NDJSON, oldest first
+
+    Rows are read through a server-side cursor in batches of
+    FAVOURITES_EXPORT_BATCH_SIZE, so the table is never held in memory.
+    Each line can be fed back to the import endpoint.
+    """
+    columns = [getattr(Favourite, field) for field in FAVOURITE_FIELDS] + [Favourite.created_at]
+    query = (
+        select(*columns)
+        .order_by(Favourite.id)
+        .execution_options(yield_per=settings.FAVOURITES_EXPORT_BATCH_SIZE)
+    )
+    async with SessionLocal() as db:
+        result = await db.stream(query)
+        async for partition in result.mappings().partitions():
+            yield b"".join(orjson.dumps(dict(row)) + b"\n" for row in partition)
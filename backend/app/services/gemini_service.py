@@ -1,13 +1,35 @@
 """Gemini AI service for mood-to-genre conversion"""
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+import asyncio
 import logging
-from typing import Dict, List
+from typing import AsyncIterator, Dict, List, Optional, Set
 import json
 import re
+from .upstream import RetryHint, Upstream, UpstreamError
 from ..config import settings
+from ..metrics import UPSTREAM_REQUESTS, track_stage
 
 logger = logging.getLogger("uvicorn")
 
+# Gemini API errors worth retrying; quota errors also slow the rate limiter
+_THROTTLE_ERRORS = (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)
+_TRANSIENT_ERRORS = (
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.DeadlineExceeded,
+    asyncio.TimeoutError
+)
+
+
+def gemini_retry_hint(error: Exception) -> Optional[RetryHint]:
+    """Classify Gemini errors: quota, 5xx and timeouts are retryable"""
+    if isinstance(error, _THROTTLE_ERRORS):
+        return RetryHint(throttled=True)
+    if isinstance(error, _TRANSIENT_ERRORS):
+        return RetryHint()
+    return None
+
 
 class GeminiService:
     """Service for interacting with Google Gemini AI"""
@@ -36,21 +58,101 @@ class GeminiService:
         "western": 37
     }
     
+    # Explanation returned when the model could not be used
+    FALLBACK_EXPLANATION = "Based on your mood, we've selected a mix of drama and comedy films that might resonate with you right now."
+    
+    # Bounds the number of in-flight model calls across all instances
+    _semaphore = asyncio.Semaphore(settings.GEMINI_MAX_CONCURRENCY)
+    
+    # Rate limit, retries and circuit breaker shared by every model call
+    _upstream = Upstream(
+        "gemini",
+        classify=gemini_retry_hint,
+        rate=settings.GEMINI_RATE_LIMIT,
+        burst=settings.GEMINI_RATE_BURST,
+        max_retries=settings.GEMINI_MAX_RETRIES,
+        backoff_base=settings.UPSTREAM_BACKOFF_BASE,
+        backoff_max=settings.UPSTREAM_BACKOFF_MAX,
+        max_wait=settings.UPSTREAM_MAX_WAIT,
+        failure_threshold=settings.UPSTREAM_FAILURE_THRESHOLD,
+        reset_timeout=settings.UPSTREAM_RESET_TIMEOUT
+    )
+    
+    # Moods waiting for the next batched call (GEMINI_BATCH_ENABLED), each
+    # with the futures of the requests waiting on it. Full resolutions and
+    # genre-only resolutions (pipeline mode) are batched separately.
+    _batch: Dict[bool, Dict[str, List[asyncio.Future]]] = {False: {}, True: {}}
+    _batch_timer: Dict[bool, Optional[asyncio.TimerHandle]] = {False: None, True: None}
+    _batch_tasks: Set[asyncio.Task] = set()
+    _batch_stats = {"batches": 0, "answered": 0, "retried": 0}
+    
     def __init__(self):
         """Initialize Gemini AI client"""
         genai.configure(api_key=settings.GEMINI_API_KEY)
         self.model = genai.GenerativeModel(settings.GEMINI_MODEL)
     
+    async def warm_up(self) -> None:
+        """Make a cheap token-count call so the model handle and gRPC channel are ready"""
+        try:
+            await asyncio.wait_for(
+                self.model.count_tokens_async("warm-up"),
+                timeout=settings.WARMUP_TIMEOUT
+            )
+        except Exception as e:
+            logger.warning(f"Gemini warm-up failed: {type(e).__name__}: {str(e)}")
+    
+    async def _generate(self, prompt: str, max_output_tokens: Optional[int] = None):
+        """
+        Call the model without blocking the event loop
+        
+        Uses the SDK's async API, bounded by a shared semaphore and
+        GEMINI_TIMEOUT so a slow call cannot hold the worker, under the
+        Gemini rate limit, retries and circuit breaker.
+        
+        Args:
+            prompt: Prompt text
+            max_output_tokens: Cap on the generated length, for short answers
+        
+        Raises:
+            UpstreamError: Gemini is unavailable or over quota
+        """
+        async def attempt():
+            async with self._semaphore:
+                try:
+                    response = await asyncio.wait_for(
+                        self.model.generate_content_async(prompt, generation_config=generation_config),
+                        timeout=settings.GEMINI_TIMEOUT
+                    )
+                except Exception as e:
+                    UPSTREAM_REQUESTS.inc(upstream="gemini", outcome=type(e).__name__)
+                    raise
+            UPSTREAM_REQUESTS.inc(upstream="gemini", outcome="ok")
+            return response
+        
+        generation_config = {"max_output_tokens": max_output_tokens} if max_output_tokens else None
+        with track_stage("gemini"):
+            return await self._upstream.call(attempt)
+    
     async def mood_to_genres(self, mood: str) -> Dict[str, any]:
         """
         Convert user's mood to movie genres using AI
         
+        With GEMINI_BATCH_ENABLED, moods arriving within GEMINI_BATCH_WINDOW
+        of each other are resolved together in one model call.
+        
         Args:
             mood: User's mood or situation description
             
         Returns:
-            Dict containing genre_ids (list) and explanation (str)
+            Dict containing genre_ids (list), explanation (str) and
+            is_fallback (bool, True when the model could not be used)
         """
+        if settings.GEMINI_BATCH_ENABLED:
+            return await self._batched_mood_to_genres(mood, genres_only=False)
+        return await self._resolve_mood(mood)
+    
+    async def _resolve_mood(self, mood: str) -> Dict[str, any]:
+        """Resolve a single mood with its own model call"""
         prompt = f"""You are a movie recommendation expert. Based on the user's mood or situation, suggest 1-3 appropriate movie genres.
 
 User's mood: "{mood}"
@@ -66,7 +168,7 @@ Respond in this EXACT JSON format:
 Only use genres from the available list. Be creative and empathetic in your explanation."""
 
         try:
-            response = self.model.generate_content(prompt)
+            response = await self._generate(prompt)
             response_text = response.text.strip()
             
             # Extract JSON from response (handle markdown code blocks)
@@ -79,11 +181,7 @@ Only use genres from the available list. Be creative and empathetic in your expl
                 data = json.loads(response_text)
             
             # Convert genre names to IDs
-            genre_ids = []
-            for genre in data.get("genres", []):
-                genre_lower = genre.lower().strip()
-                if genre_lower in self.GENRE_MAP:
-                    genre_ids.append(self.GENRE_MAP[genre_lower])
+            genre_ids = self._genre_ids(data.get("genres", []))
             
             # Fallback if no valid genres found
             if not genre_ids:
@@ -91,13 +189,322 @@ Only use genres from the available list. Be creative and empathetic in your expl
             
             return {
                 "genre_ids": genre_ids[:3],  # Limit to 3 genres
-                "explanation": data.get("explanation", "Based on your mood, here are some great movie recommendations!")
+                "explanation": data.get("explanation", "Based on your mood, here are some great movie recommendations!"),
+                "is_fallback": False
             }
             
         except Exception as e:
-            logger.error(f"Gemini API error: {type(e).__name__}: {str(e)}")
-            # Fallback response
-            return {
-                "genre_ids": [18, 35],  # Drama and Comedy
-                "explanation": "Based on your mood, we've selected a mix of drama and comedy films that might resonate with you right now."
-            }
+            if isinstance(e, UpstreamError):
+                logger.error(f"Gemini unavailable, using fallback genres: {str(e)}")
+            else:
+                logger.error(f"Gemini API error: {type(e).__name__}: {str(e)}")
+            return self._fallback_resolution()
+    
+    @classmethod
+    def _fallback_resolution(cls, genres_only: bool = False) -> Dict[str, any]:
+        """Resolution used when the model could not be used"""
+        if genres_only:
+            return {"genre_ids": [18, 35], "is_fallback": True}
+        return {
+            "genre_ids": [18, 35],  # Drama and Comedy
+            "explanation": cls.FALLBACK_EXPLANATION,
+            "is_fallback": True
+        }
+    
+    async def _batched_mood_to_genres(self, mood: str, genres_only: bool) -> Dict[str, any]:
+        """Queue a mood for the next batched model call and wait for its resolution"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        batch = GeminiService._batch[genres_only]
+        batch.setdefault(mood, []).append(future)
+        if len(batch) >= settings.GEMINI_BATCH_MAX_SIZE:
+            self._flush_batch(genres_only)
+        elif GeminiService._batch_timer[genres_only] is None:
+            GeminiService._batch_timer[genres_only] = loop.call_later(
+                settings.GEMINI_BATCH_WINDOW, self._flush_batch, genres_only
+            )
+        return await future
+    
+    def _flush_batch(self, genres_only: bool) -> None:
+        """Start resolving the queued moods and open a new batch"""
+        timer = GeminiService._batch_timer[genres_only]
+        if timer is not None:
+            timer.cancel()
+            GeminiService._batch_timer[genres_only] = None
+        batch, GeminiService._batch[genres_only] = GeminiService._batch[genres_only], {}
+        if batch:
+            task = asyncio.create_task(self._resolve_batch(batch, genres_only))
+            GeminiService._batch_tasks.add(task)
+            task.add_done_callback(GeminiService._batch_tasks.discard)
+    
+    async def _resolve_batch(self, batch: Dict[str, List[asyncio.Future]], genres_only: bool) -> None:
+        """Resolve a batch of moods and hand each waiting request its result"""
+        moods = list(batch)
+        results: Dict[str, Dict] = {}
+        try:
+            if len(moods) > 1:
+                results = await self._resolve_moods(moods, genres_only)
+            elif genres_only:
+                results[moods[0]] = await self._resolve_genre_ids(moods[0])
+            else:
+                results[moods[0]] = await self._resolve_mood(moods[0])
+        except Exception as e:
+            logger.error(f"Gemini batch error: {type(e).__name__}: {str(e)}")
+        finally:
+            # Every waiter gets an answer, even if resolving failed or was cancelled
+            for mood, futures in batch.items():
+                result = results.get(mood) or self._fallback_resolution(genres_only)
+                for future in futures:
+                    if not future.done():
+                        future.set_result(dict(result))
+    
+    async def _resolve_moods(self, moods: List[str], genres_only: bool = False, retry: bool = True) -> Dict[str, Dict]:
+        """
+        Resolve several moods with one prompt returning a JSON array
+        
+        Moods the response leaves out or answers unusably are sent again
+        together in one more batched call, so one bad item doesn't cost the
+        others their answer and a bad reply costs at most one extra call.
+        Moods still unanswered get the fallback resolution.
+        
+        Args:
+            moods: Distinct moods to resolve
+            genres_only: Ask for genres without explanations, as
+                mood_to_genre_ids does
+            retry: Re-batch the moods this call leaves unanswered
+        
+        Returns:
+            Dict mapping each mood to a resolution, as from mood_to_genres
+            (or mood_to_genre_ids when genres_only)
+        """
+        numbered = "\n".join(f"{number}. {json.dumps(mood)}" for number, mood in enumerate(moods, 1))
+        if genres_only:
+            item_format = '{"id": 1, "genres": ["genre1", "genre2"]}'
+            closing = "Only use genres from the available list."
+        else:
+            item_format = '{"id": 1, "genres": ["genre1", "genre2"], "explanation": "A friendly 2-3 sentence explanation of why these genres match the mood."}'
+            closing = "Only use genres from the available list. Be creative and empathetic in your explanations."
+        prompt = f"""You are a movie recommendation expert. For each numbered mood or situation below, suggest 1-3 appropriate movie genres.
+
+Moods:
+{numbered}
+
+Available genres: {', '.join(self.GENRE_MAP.keys())}
+
+Respond with ONLY a JSON array holding one object per mood, in this EXACT format:
+[
+    {item_format}
+]
+
+{closing}"""
+
+        stats = GeminiService._batch_stats
+        stats["batches"] += 1
+        try:
+            response = await self._generate(prompt)
+            items = self._parse_batch(response.text, len(moods))
+        except UpstreamError as e:
+            logger.error(f"Gemini unavailable, using fallback genres for {len(moods)} moods: {str(e)}")
+            return {mood: self._fallback_resolution(genres_only) for mood in moods}
+        except Exception as e:
+            logger.error(f"Gemini batch response error: {type(e).__name__}: {str(e)}")
+            items = {}
+        
+        results = {}
+        missing = []
+        for number, mood in enumerate(moods, 1):
+            item = items.get(number, {})
+            genres = item.get("genres")
+            genre_ids = self._genre_ids(genres) if isinstance(genres, list) else []
+            explanation = item.get("explanation")
+            if genre_ids and genres_only:
+                results[mood] = {"genre_ids": genre_ids[:3], "is_fallback": False}
+            elif genre_ids and isinstance(explanation, str) and explanation.strip():
+                results[mood] = {"genre_ids": genre_ids[:3], "explanation": explanation.strip(), "is_fallback": False}
+            else:
+                missing.append(mood)
+        
+        stats["answered"] += len(results)
+        if missing and retry:
+            stats["retried"] += len(missing)
+            logger.warning(f"Gemini batch answered {len(results)}/{len(moods)} moods, re-batching the rest")
+            results.update(await self._resolve_moods(missing, genres_only, retry=False))
+        elif missing:
+            logger.warning(f"Gemini batch left {len(missing)} moods unanswered, using fallback genres")
+            results.update({mood: self._fallback_resolution(genres_only) for mood in missing})
+        return results
+    
+    @staticmethod
+    def _parse_batch(text: str, count: int) -> Dict[int, Dict]:
+        """Parse a batch response into its items by mood number (1-based)"""
+        match = re.search(r"\[[\s\S]*\]", text)
+        data = json.loads(match.group(0) if match else text)
+        items = {}
+        for position, item in enumerate(data if isinstance(data, list) else [], 1):
+            if not isinstance(item, dict):
+                continue
+            number = item.get("id", position)
+            if isinstance(number, int) and 1 <= number <= count:
+                items.setdefault(number, item)
+        return items
+    
+    @classmethod
+    def batch_stats(cls) -> Dict:
+        """Return batched call counters"""
+        return dict(cls._batch_stats)
+    
+    async def mood_to_genre_ids(self, mood: str) -> Dict[str, any]:
+        """
+        Convert a mood to genres only, without an explanation
+        
+        A one-line answer generates much faster than the full JSON
+        response, so the TMDB fetch can start sooner. With
+        GEMINI_BATCH_ENABLED, concurrent moods share one genre-only call.
+        
+        Args:
+            mood: User's mood or situation description
+            
+        Returns:
+            Dict containing genre_ids (list) and is_fallback (bool)
+        """
+        if settings.GEMINI_BATCH_ENABLED:
+            return await self._batched_mood_to_genres(mood, genres_only=True)
+        return await self._resolve_genre_ids(mood)
+    
+    async def _resolve_genre_ids(self, mood: str) -> Dict[str, any]:
+        """Resolve a single mood's genres with its own model call"""
+        prompt = f"""You are a movie recommendation expert. Suggest 1-3 movie genres for the user's mood or situation.
+
+User's mood: "{mood}"
+
+Available genres: {', '.join(self.GENRE_MAP.keys())}
+
+Reply with ONLY the genre names from the available list, comma-separated, on one line."""
+
+        try:
+            response = await self._generate(prompt, max_output_tokens=24)
+            genre_ids = self._genre_ids(response.text.strip().splitlines()[0].split(","))
+            if genre_ids:
+                return {"genre_ids": genre_ids[:3], "is_fallback": False}
+            logger.warning("Gemini genre-only response named no known genres, using fallback genres")
+        except Exception as e:
+            logger.error(f"Gemini genre resolution error: {type(e).__name__}: {str(e)}")
+        return self._fallback_resolution(genres_only=True)
+    
+    async def explain_genres(self, mood: str, genre_ids: List[int]) -> Optional[str]:
+        """
+        Write the explanation for genres already chosen for a mood
+        
+        Args:
+            mood: User's mood or situation description
+            genre_ids: TMDB genre IDs picked for the mood
+            
+        Returns:
+            A 2-3 sentence explanation, or None if the model could not be used
+        """
+        names = [name for name, genre_id in self.GENRE_MAP.items() if genre_id in genre_ids and name != "sci-fi"]
+        prompt = f"""You are a movie recommendation expert. The user described their mood, and we picked these movie genres for them: {', '.join(names)}.
+
+User's mood: "{mood}"
+
+Write a friendly 2-3 sentence explanation of why these genres match the mood. Reply with the explanation only. Be creative and empathetic."""
+
+        try:
+            response = await self._generate(prompt)
+            return response.text.strip() or None
+        except Exception as e:
+            logger.error(f"Gemini explanation error: {type(e).__name__}: {str(e)}")
+            return None
+    
+    async def stream_mood_to_genres(self, mood: str) -> AsyncIterator[Dict]:
+        """
+        Convert a mood to genres, streaming the explanation as it is written
+        
+        The model is asked to name the genres on its first line, so they
+        are known as soon as that line arrives, well before the
+        explanation is complete.
+        
+        Args:
+            mood: User's mood or situation description
+            
+        Yields:
+            One {"genre_ids", "is_fallback"} dict, then {"text"} dicts with
+            successive pieces of the explanation. If the model fails before
+            naming genres, the fallback genres and explanation are yielded;
+            if it fails afterwards, {"incomplete": True} ends the stream.
+        """
+        prompt = f"""You are a movie recommendation expert. Based on the user's mood or situation, suggest 1-3 appropriate movie genres.
+
+User's mood: "{mood}"
+
+Available genres: {', '.join(self.GENRE_MAP.keys())}
+
+Respond in this EXACT format, with no markdown:
+GENRES: genre1, genre2
+A friendly 2-3 sentence explanation of why these genres match the mood.
+
+Only use genres from the available list. Be creative and empathetic in your explanation."""
+
+        async def attempt():
+            async with self._semaphore:
+                try:
+                    response = await asyncio.wait_for(
+                        self.model.generate_content_async(prompt, stream=True),
+                        timeout=settings.GEMINI_TIMEOUT
+                    )
+                except Exception as e:
+                    UPSTREAM_REQUESTS.inc(upstream="gemini", outcome=type(e).__name__)
+                    raise
+            UPSTREAM_REQUESTS.inc(upstream="gemini", outcome="ok")
+            return response
+        
+        genre_ids = None
+        buffer = ""
+        try:
+            with track_stage("gemini"):
+                response = await self._upstream.call(attempt)
+            chunks = response.__aiter__()
+            while True:
+                # Hold a Gemini slot only while fetching, not while a slow
+                # client reads what has already been yielded
+                async with self._semaphore:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), timeout=settings.GEMINI_TIMEOUT)
+                    except StopAsyncIteration:
+                        break
+                text = chunk.text
+                if genre_ids is not None:
+                    if text:
+                        yield {"text": text}
+                    continue
+                
+                buffer += text
+                if "\n" not in buffer:
+                    continue
+                first_line, buffer = buffer.split("\n", 1)
+                genre_ids = self._genre_ids(re.sub(r"^\W*genres\W*", "", first_line, flags=re.I).split(","))
+                yield {"genre_ids": genre_ids[:3] or [18, 35], "is_fallback": False}
+                if buffer.strip():
+                    yield {"text": buffer.lstrip()}
+            
+            if genre_ids is None and buffer:
+                # The whole answer fit on one line: genres without explanation
+                genre_ids = self._genre_ids(re.sub(r"^\W*genres\W*", "", buffer, flags=re.I).split(","))
+                yield {"genre_ids": genre_ids[:3] or [18, 35], "is_fallback": False}
+        except Exception as e:
+            logger.error(f"Gemini stream error: {type(e).__name__}: {str(e)}")
+            if genre_ids is not None:
+                yield {"incomplete": True}
+        
+        if genre_ids is None:
+            yield {"genre_ids": [18, 35], "is_fallback": True}
+            yield {"text": self.FALLBACK_EXPLANATION}
+    
+    def _genre_ids(self, names: List[str]) -> List[int]:
+        """Map genre names from a model response to TMDB genre IDs"""
+        genre_ids = []
+        for name in names:
+            genre_id = self.GENRE_MAP.get(re.sub(r"[^\w\s-]", "", str(name)).lower().strip())
+            if genre_id is not None and genre_id not in genre_ids:
+                genre_ids.append(genre_id)
+        return genre_ids
@@ -0,0 +1,234 @@
+"""Multi-genre discover fan-out with merged ranking"""
+import asyncio
+import base64
+import heapq
+import logging
+import math
+from itertools import combinations
+from typing import Dict, List, Optional, Tuple
+
+from .upstream import UpstreamError
+from ..config import settings
+
+logger = logging.getLogger("uvicorn")
+
+# Results per merged page, matching TMDB's discover endpoint
+PAGE_SIZE = 20
+# Popularity that earns the full popularity score (log-scaled)
+POPULARITY_CEILING = 1000.0
+# Bayesian rating prior: votes needed before a movie's own average
+# dominates, and the average pulled towards until then
+RATING_PRIOR_VOTES = 500
+RATING_PRIOR_MEAN = 6.5
+
+# Merge position of a movie: (-score, movie_id), ascending
+SortKey = Tuple[float, int]
+
+
+class InvalidCursor(ValueError):
+    """Raised for a cursor that was not produced by encode_cursor"""
+
+
+def genre_queries(genre_ids: List[int]) -> List[List[int]]:
+    """
+    List the genre combinations queried for a set of genres
+
+    The full combination (TMDB treats with_genres as AND), every pair
+    and every single genre, so broad genres fill the pages that the strict
+    intersection leaves short.
+    """
+    genre_ids = list(dict.fromkeys(genre_ids))
+    sizes = sorted({len(genre_ids), 2, 1} & set(range(1, len(genre_ids) + 1)), reverse=True)
+    return [list(combo) for size in sizes for combo in combinations(genre_ids, size)]
+
+
+def _popularity_score(popularity: float) -> float:
+    """Log-scale popularity into [0, 1]"""
+    return min(1.0, math.log1p(max(0.0, popularity or 0.0)) / math.log1p(POPULARITY_CEILING))
+
+
+def score_movie(movie: Dict, genre_ids: List[int]) -> float:
+    """
+    Weighted relevance of a movie to the requested genres, in [0, 1]
+
+    Combines log-scaled popularity, a Bayesian vote average and the
+    share of requested genres the movie has. The score depends only on
+    the movie and the request, so it is identical in every source list.
+    """
+    popularity = _popularity_score(movie.get("popularity"))
+    votes = movie.get("vote_count") or 0
+    rating = ((movie.get("vote_average") or 0.0) * votes + RATING_PRIOR_MEAN * RATING_PRIOR_VOTES) / (votes + RATING_PRIOR_VOTES)
+    overlap = len(set(movie.get("genre_ids") or []) & set(genre_ids)) / len(genre_ids)
+    score = (
+        settings.FANOUT_WEIGHT_POPULARITY * popularity
+        + settings.FANOUT_WEIGHT_RATING * rating / 10.0
+        + settings.FANOUT_WEIGHT_OVERLAP * overlap
+    )
+    # Rounded so the score survives a trip through a cursor unchanged
+    return round(score, 6)
+
+
+def encode_cursor(key: SortKey) -> str:
+    """Encode the position after the last movie served"""
+    raw = f"{-key[0]!r}|{key[1]}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> SortKey:
+    """Decode a cursor produced by encode_cursor"""
+    try:
+        score, movie_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return -float(score), int(movie_id)
+    except Exception:
+        raise InvalidCursor("Invalid cursor")
+
+
+def plan_pages(sources: List[Dict], budget: int) -> List[Tuple[Dict, int]]:
+    """
+    Pick the pages after page 1 that fit in the remaining call budget
+
+    Sources are deepened one page at a time in priority order (full
+    combination, then pairs, then single genres), never past their last
+    page or FANOUT_MAX_PAGES.
+    """
+    planned = []
+    for page in range(2, settings.FANOUT_MAX_PAGES + 1):
+        for source in sources:
+            if len(planned) >= budget:
+                return planned
+            if not source["failed"] and page <= source["total_pages"]:
+                planned.append((source, page))
+    return planned
+
+
+class GenreFanout:
+    """
+    Discover movies for several genres as one merged, ranked stream
+
+    Each request reads the same window of discover pages: page 1 of every
+    genre combination from `genre_queries`, then deeper pages in priority
+    order, at most FANOUT_MAX_CALLS pages in all. Every source list is
+    sorted by score, and the lists are combined with a heap-based k-way
+    merge that drops duplicates. Ranking is exact within the window, and
+    `total_pages` counts exactly the pages the window can serve.
+
+    Pages are addressed by page number or by keyset cursor. A cursor holds
+    the (score, movie ID) of the last movie served, so the next page starts
+    strictly after it. Scores are recomputed from TMDB data on every
+    request, so once cached discover pages refresh, a movie whose
+    popularity changed can move across the cursor and be skipped or shown
+    again.
+    """
+
+    def __init__(self, tmdb_service):
+        """
+        Args:
+            tmdb_service: TMDBService used to fetch each discover page
+        """
+        self.tmdb_service = tmdb_service
+
+    async def discover(
+        self,
+        genre_ids: List[int],
+        page: int = 1,
+        cursor: Optional[str] = None
+    ) -> Dict:
+        """
+        Fetch one page of the merged stream
+
+        Args:
+            genre_ids: List of TMDB genre IDs
+            page: Page number, used to find the position when no cursor
+                is given
+            cursor: next_cursor from the previous page
+
+        Returns:
+            Dict shaped like TMDBService.discover_movies, plus next_cursor
+            (None on the last page). total_results and total_pages count
+            the movies the window holds, not TMDB's totals.
+
+        Raises:
+            InvalidCursor: The cursor is malformed
+            UpstreamError: TMDB is unavailable for every source query
+        """
+        after = decode_cursor(cursor) if cursor else None
+        skip = 0 if cursor else (page - 1) * PAGE_SIZE
+
+        # The full combination and pairs come first, so they keep their
+        # page 1 when the budget cannot cover every single genre
+        sources = [
+            {"genre_ids": query, "pages": {}, "total_pages": 1, "failed": False}
+            for query in genre_queries(genre_ids)[:settings.FANOUT_MAX_CALLS]
+        ]
+        await self._fetch([(source, 1) for source in sources], sources)
+        await self._fetch(plan_pages(sources, settings.FANOUT_MAX_CALLS - len(sources)), sources)
+
+        ranked = self._merge(sources, genre_ids)
+        total_results = len(ranked)
+        if after is not None:
+            ranked = [item for item in ranked if item[0] > after]
+        merged = ranked[skip:skip + PAGE_SIZE + 1]
+
+        next_cursor = None
+        if len(merged) > PAGE_SIZE:
+            merged = merged[:PAGE_SIZE]
+            next_cursor = encode_cursor(merged[-1][0])
+
+        return {
+            "results": [movie for _, movie in merged],
+            "page": page,
+            "total_pages": max(1, math.ceil(total_results / PAGE_SIZE)),
+            "total_results": total_results,
+            "next_cursor": next_cursor
+        }
+
+    async def _fetch(self, wanted: List[Tuple[Dict, int]], sources: List[Dict]) -> None:
+        """
+        Fetch the wanted (source, page) pairs concurrently
+
+        A source whose fetch fails stops growing; if TMDB is unavailable
+        for every source, the error is raised.
+        """
+        if not wanted:
+            return
+        responses = await asyncio.gather(
+            *(self.tmdb_service.discover_movies(source["genre_ids"], page=page) for source, page in wanted),
+            return_exceptions=True
+        )
+        upstream_error = None
+        for (source, page), response in zip(wanted, responses):
+            if isinstance(response, BaseException):
+                if isinstance(response, UpstreamError):
+                    upstream_error = response
+                logger.warning(f"Fan-out query {source['genre_ids']} page {page} failed: {type(response).__name__}")
+                source["failed"] = True
+                continue
+            source["pages"][page] = response["results"]
+            source["total_pages"] = response["total_pages"]
+
+        if upstream_error is not None and all(not source["pages"] for source in sources):
+            raise upstream_error
+
+    @staticmethod
+    def _merge(sources: List[Dict], genre_ids: List[int]) -> List[Tuple[SortKey, Dict]]:
+        """
+        K-way merge the source lists into ranked, de-duplicated movies
+
+        Returns:
+            Every (key, movie) pair in the window, best first
+        """
+        ranked_sources = []
+        for source in sources:
+            movies = [movie for page in sorted(source["pages"]) for movie in source["pages"][page]]
+            ranked_sources.append(sorted(
+                ((-score_movie(movie, genre_ids), movie["id"]), movie) for movie in movies
+            ))
+
+        merged = []
+        seen = set()
+        for key, movie in heapq.merge(*ranked_sources, key=lambda item: item[0]):
+            if key[1] in seen:
+                continue
+            seen.add(key[1])
+            merged.append((key, movie))
+        return merged
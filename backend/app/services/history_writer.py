@@ -0,0 +1,139 @@
+"""Write-behind queue for search history"""
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import insert
+
+from .search_stats import index_statements
+from ..config import settings
+from ..database import SessionLocal
+from ..models.models import History
+
+logger = logging.getLogger("uvicorn")
+
+# Queue marker telling the writer to flush what it has and exit
+_STOP = object()
+
+
+class HistoryWriter:
+    """
+    Background writer that batches History inserts off the request path
+
+    Searches are queued with `record()` and written by a background task
+    in a single bulk INSERT once `batch_size` rows are pending or
+    `flush_interval` seconds have passed since the first pending row.
+    `stop()` drains everything still queued.
+    """
+
+    def __init__(self, batch_size: int, flush_interval: float, max_queue_size: int):
+        """
+        Args:
+            batch_size: Maximum rows per INSERT
+            flush_interval: Seconds to wait for a batch to fill before flushing
+            max_queue_size: Pending rows kept before new entries are dropped
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue_size = max_queue_size
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        self._task: Optional[asyncio.Task] = None
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+
+    def start(self) -> None:
+        """Start the background flush task on the running event loop"""
+        if self._task is None or self._task.done():
+            # Queues bind to the loop that first waits on them, so move any
+            # pending rows onto a fresh queue for this loop
+            queue = asyncio.Queue(maxsize=self.max_queue_size)
+            while not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is not _STOP:
+                    queue.put_nowait(item)
+            self._queue = queue
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Flush every queued entry and stop the background task"""
+        if self._task is None:
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+    def record(self, mood: str, genre_ids: List[int], explanation: str) -> None:
+        """Queue a search for writing without waiting on the database"""
+        row = {
+            "mood": mood,
+            "genres": ",".join(map(str, genre_ids)),
+            "explanation": explanation,
+            "created_at": datetime.now(timezone.utc)
+        }
+        try:
+            self._queue.put_nowait(row)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning("History queue full, dropping search history entry")
+
+    def stats(self) -> Dict:
+        """Return queue depth and write counters"""
+        return {
+            "queue_depth": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "batches": self.batches
+        }
+
+    async def _run(self) -> None:
+        """Collect queued rows into batches and flush them until stopped"""
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[Dict]) -> None:
+        """Write a batch of rows with one bulk INSERT, indexing and counting them in the same transaction"""
+        try:
+            async with SessionLocal() as db:
+                result = await db.execute(insert(History).returning(History.id, sort_by_parameter_order=True), batch)
+                rows = [{**row, "id": history_id} for row, history_id in zip(batch, result.scalars())]
+                for statement in index_statements(rows):
+                    await db.execute(statement)
+                await db.commit()
+            self.written += len(batch)
+            self.batches += 1
+        except Exception as e:
+            self.failed += len(batch)
+            logger.error(f"History flush error ({len(batch)} rows): {type(e).__name__}: {str(e)}")
+
+
+# Process-wide history writer, started and drained by the app lifespan
+history_writer = HistoryWriter(
+    batch_size=settings.HISTORY_BATCH_SIZE,
+    flush_interval=settings.HISTORY_FLUSH_INTERVAL,
+    max_queue_size=settings.HISTORY_QUEUE_MAX_SIZE
+)
@@ -0,0 +1,159 @@
+"""Cache of resolved mood-to-genre mappings"""
+import logging
+import re
+import unicodedata
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+from sqlalchemy import delete, func, select
+
+from .cache import TTLCache
+from ..config import settings
+from ..database import SessionLocal
+from ..models.models import MoodCacheEntry
+
+logger = logging.getLogger("uvicorn")
+
+
+def normalize_mood(mood: str) -> str:
+    """
+    Normalize mood text into a cache key
+
+    Case, punctuation and repeated whitespace are ignored so that
+    "Happy!" and "  happy " resolve to the same entry.
+    """
+    text = unicodedata.normalize("NFKC", mood).casefold()
+    text = re.sub(r"[^\w\s'-]", " ", text)
+    return " ".join(text.split())
+
+
+class MoodCache:
+    """
+    Cache of Gemini mood resolutions keyed on normalized mood text
+
+    Entries always live in an in-process TTL/LRU cache. When `shared` is
+    enabled they are also written to the `mood_cache` table so that every
+    worker can reuse them; the in-process cache then acts as a first tier
+    in front of the table.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, shared: bool = False):
+        """
+        Args:
+            maxsize: Maximum number of moods kept per tier
+            ttl: Seconds before a resolved mood must be asked again
+            shared: Also store entries in the database table
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.shared = shared
+        self._memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, mood: str) -> Optional[Dict]:
+        """
+        Look up a previously resolved mood
+
+        Returns:
+            Dict with genre_ids and explanation, or None on a miss
+        """
+        key = normalize_mood(mood)
+        value = self._memory.get(key)
+
+        if value is None and self.shared:
+            loaded = await self._load(key)
+            if loaded is not None:
+                value, remaining = loaded
+                self._memory.set(key, value, ttl=remaining)
+
+        if value is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return {"genre_ids": list(value["genre_ids"]), "explanation": value["explanation"]}
+
+    async def set(self, mood: str, genre_ids, explanation: str) -> None:
+        """Store the resolution of a mood"""
+        key = normalize_mood(mood)
+        value = {"genre_ids": list(genre_ids), "explanation": explanation}
+        self._memory.set(key, value)
+
+        if self.shared:
+            await self._store(key, value)
+
+    def stats(self) -> Dict:
+        """Return hit/miss counters and in-process cache size"""
+        lookups = self.hits + self.misses
+        return {
+            "backend": "sql" if self.shared else "memory",
+            "size": len(self._memory),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0
+        }
+
+    async def _load(self, key: str) -> Optional[tuple]:
+        """Read an unexpired entry from the shared table and mark it as used"""
+        now = datetime.now(timezone.utc)
+        try:
+            async with SessionLocal() as db:
+                entry = await db.get(MoodCacheEntry, key)
+                if entry is None:
+                    return None
+                expires_at = entry.expires_at
+                if expires_at.tzinfo is None:
+                    expires_at = expires_at.replace(tzinfo=timezone.utc)
+                if expires_at <= now:
+                    return None
+
+                entry.last_used_at = now
+                await db.commit()
+                value = {
+                    "genre_ids": [int(g) for g in entry.genres.split(",") if g],
+                    "explanation": entry.explanation
+                }
+                return value, (expires_at - now).total_seconds()
+        except Exception as e:
+            logger.error(f"Mood cache read error: {type(e).__name__}: {str(e)}")
+            return None
+
+    async def _store(self, key: str, value: Dict) -> None:
+        """Upsert an entry in the shared table and trim expired or excess rows"""
+        now = datetime.now(timezone.utc)
+        try:
+            async with SessionLocal() as db:
+                await db.merge(MoodCacheEntry(
+                    mood_key=key,
+                    genres=",".join(map(str, value["genre_ids"])),
+                    explanation=value["explanation"],
+                    expires_at=now + timedelta(seconds=self.ttl),
+                    last_used_at=now
+                ))
+                await db.flush()
+                await db.execute(
+                    delete(MoodCacheEntry).where(MoodCacheEntry.expires_at <= now)
+                )
+
+                overflow = await db.scalar(select(func.count(MoodCacheEntry.mood_key))) - self.maxsize
+                if overflow > 0:
+                    least_recent = (
+                        select(MoodCacheEntry.mood_key)
+                        .order_by(MoodCacheEntry.last_used_at.asc())
+                        .limit(overflow)
+                    )
+                    await db.execute(
+                        delete(MoodCacheEntry).where(MoodCacheEntry.mood_key.in_(least_recent))
+                    )
+                await db.commit()
+        except Exception as e:
+            logger.error(f"Mood cache write error: {type(e).__name__}: {str(e)}")
+
+
+# Process-wide mood cache
+mood_cache = MoodCache(
+    maxsize=settings.MOOD_CACHE_MAX_SIZE,
+    ttl=settings.MOOD_CACHE_TTL,
+    shared=settings.MOOD_CACHE_BACKEND == "sql"
+)
@@ -0,0 +1,215 @@
+"""Local keyword classifier for resolving obvious moods without Gemini"""
+from typing import Dict, List, Optional, Tuple
+
+from .gemini_service import GeminiService
+from .mood_cache import normalize_mood
+from ..config import settings
+
+# Phrase -> {genre name: weight}. Weights are the confidence that the phrase
+# alone implies the genre; several matches for one genre combine as a
+# noisy-OR, so two medium hints are stronger than either one.
+LEXICON: Dict[str, Dict[str, float]] = {
+    # Comedy
+    "laugh": {"comedy": 0.9},
+    "laughing": {"comedy": 0.9},
+    "laughs": {"comedy": 0.9},
+    "funny": {"comedy": 0.9},
+    "hilarious": {"comedy": 0.95},
+    "comedy": {"comedy": 0.95},
+    "silly": {"comedy": 0.7},
+    "goofy": {"comedy": 0.7},
+    "cheer me up": {"comedy": 0.8, "family": 0.3},
+    "lighthearted": {"comedy": 0.7, "family": 0.3},
+    "light hearted": {"comedy": 0.7, "family": 0.3},
+    "happy": {"comedy": 0.6},
+    # Horror / thriller
+    "scary": {"horror": 0.9},
+    "scared": {"horror": 0.8},
+    "spooky": {"horror": 0.85},
+    "creepy": {"horror": 0.8},
+    "terrifying": {"horror": 0.9},
+    "horror": {"horror": 0.95},
+    "halloween": {"horror": 0.85},
+    "ghost": {"horror": 0.7},
+    "ghosts": {"horror": 0.7},
+    "nightmare": {"horror": 0.6},
+    "suspense": {"thriller": 0.85},
+    "suspenseful": {"thriller": 0.85},
+    "thriller": {"thriller": 0.95},
+    "edge of my seat": {"thriller": 0.9},
+    "tense": {"thriller": 0.6},
+    # Romance
+    "date night": {"romance": 0.85, "comedy": 0.5},
+    "romantic": {"romance": 0.9},
+    "romance": {"romance": 0.95},
+    "love story": {"romance": 0.9},
+    "in love": {"romance": 0.8},
+    "valentine": {"romance": 0.85},
+    "valentines": {"romance": 0.85},
+    "crush": {"romance": 0.6},
+    # Action / adventure
+    "action": {"action": 0.95},
+    "adrenaline": {"action": 0.85},
+    "explosions": {"action": 0.85},
+    "fight": {"action": 0.6},
+    "fights": {"action": 0.6},
+    "pumped": {"action": 0.7},
+    "adventure": {"adventure": 0.9},
+    "epic": {"adventure": 0.6, "fantasy": 0.4},
+    "quest": {"adventure": 0.7, "fantasy": 0.4},
+    "explore": {"adventure": 0.6},
+    # Drama / sadness
+    "sad": {"drama": 0.8},
+    "cry": {"drama": 0.85},
+    "crying": {"drama": 0.85},
+    "tearjerker": {"drama": 0.9},
+    "heartbroken": {"drama": 0.8, "romance": 0.4},
+    "heartbreak": {"drama": 0.8, "romance": 0.4},
+    "emotional": {"drama": 0.75},
+    "drama": {"drama": 0.95},
+    "depressed": {"drama": 0.6, "comedy": 0.4},
+    "lonely": {"drama": 0.6, "romance": 0.4},
+    # Family / animation
+    "kids": {"family": 0.85, "animation": 0.6},
+    "children": {"family": 0.85, "animation": 0.6},
+    "family": {"family": 0.9},
+    "family night": {"family": 0.9, "animation": 0.5},
+    "cartoon": {"animation": 0.9},
+    "cartoons": {"animation": 0.9},
+    "animated": {"animation": 0.9},
+    "animation": {"animation": 0.95},
+    "anime": {"animation": 0.9},
+    "wholesome": {"family": 0.7, "comedy": 0.3},
+    # Sci-fi / fantasy
+    "space": {"science fiction": 0.8},
+    "aliens": {"science fiction": 0.85},
+    "alien": {"science fiction": 0.8},
+    "future": {"science fiction": 0.6},
+    "futuristic": {"science fiction": 0.85},
+    "robots": {"science fiction": 0.85},
+    "sci fi": {"science fiction": 0.95},
+    "sci-fi": {"science fiction": 0.95},
+    "science fiction": {"science fiction": 0.95},
+    "magic": {"fantasy": 0.85},
+    "magical": {"fantasy": 0.85},
+    "dragons": {"fantasy": 0.9},
+    "fantasy": {"fantasy": 0.95},
+    "fairy tale": {"fantasy": 0.85, "family": 0.3},
+    # Mystery / crime
+    "mystery": {"mystery": 0.95},
+    "whodunit": {"mystery": 0.95},
+    "detective": {"mystery": 0.8, "crime": 0.6},
+    "puzzle": {"mystery": 0.6},
+    "crime": {"crime": 0.95},
+    "heist": {"crime": 0.9, "thriller": 0.4},
+    "gangster": {"crime": 0.9},
+    "mafia": {"crime": 0.9},
+    # Other genres
+    "documentary": {"documentary": 0.95},
+    "learn something": {"documentary": 0.8},
+    "true story": {"history": 0.6, "drama": 0.5},
+    "history": {"history": 0.85},
+    "historical": {"history": 0.9},
+    "music": {"music": 0.85},
+    "musical": {"music": 0.9},
+    "sing": {"music": 0.7},
+    "dance": {"music": 0.7},
+    "war": {"war": 0.85},
+    "soldiers": {"war": 0.8},
+    "western": {"western": 0.9},
+    "cowboy": {"western": 0.9},
+    "cowboys": {"western": 0.9},
+}
+
+# Words that can flip the meaning of a phrase; moods containing them are
+# left to Gemini rather than guessed at
+NEGATIONS = {"not", "no", "dont", "don't", "nothing", "without", "never", "avoid"}
+
+# Longest lexicon phrase, in tokens
+MAX_PHRASE_TOKENS = max(len(phrase.split()) for phrase in LEXICON)
+
+
+class MoodClassifier:
+    """
+    Keyword and lexicon scorer for moods that clearly map onto genres
+
+    Resolves in microseconds and reports a confidence in [0, 1] so callers
+    can fall back to Gemini for anything ambiguous.
+    """
+
+    # Preferred display name for each genre ID
+    GENRE_NAMES = {
+        genre_id: name
+        for name, genre_id in reversed(list(GeminiService.GENRE_MAP.items()))
+    }
+
+    def __init__(self, threshold: float):
+        """
+        Args:
+            threshold: Minimum confidence for an answer to be used
+        """
+        self.threshold = threshold
+
+    def score(self, mood: str) -> Dict[str, float]:
+        """
+        Score every genre mentioned or implied by the mood
+
+        Returns:
+            Dict of genre name -> confidence in [0, 1], empty when the
+            mood contains a negation
+        """
+        tokens = normalize_mood(mood).split()
+        misses: Dict[str, float] = {}
+        if NEGATIONS.intersection(tokens):
+            return {}
+
+        for start in range(len(tokens)):
+            for length in range(1, MAX_PHRASE_TOKENS + 1):
+                if start + length > len(tokens):
+                    break
+                weights = LEXICON.get(" ".join(tokens[start:start + length]))
+                if weights is None:
+                    continue
+                for genre, weight in weights.items():
+                    misses[genre] = misses.get(genre, 1.0) * (1.0 - weight)
+
+        return {genre: 1.0 - miss for genre, miss in misses.items()}
+
+    def classify(self, mood: str) -> Optional[Dict]:
+        """
+        Resolve a mood locally when confidence clears the threshold
+
+        Returns:
+            Dict with genre_ids, explanation and confidence, or None when
+            the mood should be sent to Gemini
+        """
+        ranked: List[Tuple[str, float]] = sorted(
+            self.score(mood).items(), key=lambda item: item[1], reverse=True
+        )
+        if not ranked or ranked[0][1] < self.threshold:
+            return None
+
+        top_confidence = ranked[0][1]
+        genres = [genre for genre, confidence in ranked if confidence >= top_confidence / 2][:3]
+        genre_ids = list(dict.fromkeys(GeminiService.GENRE_MAP[genre] for genre in genres))
+        return {
+            "genre_ids": genre_ids,
+            "explanation": self.explain(genre_ids),
+            "confidence": top_confidence
+        }
+
+    def explain(self, genre_ids: List[int]) -> str:
+        """Build a short templated explanation for the chosen genres"""
+        names = [self.GENRE_NAMES[genre_id] for genre_id in genre_ids]
+        if len(names) > 1:
+            listed = ", ".join(names[:-1]) + " and " + names[-1]
+        else:
+            listed = names[0]
+        return (
+            f"Your mood sounds like a perfect fit for {listed} films. "
+            "We've picked popular, well-reviewed titles to match how you're feeling."
+        )
+
+
+# Process-wide mood classifier
+mood_classifier = MoodClassifier(threshold=settings.MOOD_CLASSIFIER_THRESHOLD)
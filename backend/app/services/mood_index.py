@@ -0,0 +1,274 @@
+"""Similarity index answering near-duplicate moods from earlier resolutions"""
+import logging
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func, select
+
+from .gemini_service import GeminiService
+from .mood_cache import normalize_mood
+from .mood_classifier import NEGATIONS
+from ..config import settings
+from ..database import SessionLocal
+from ..models.models import History
+
+logger = logging.getLogger("uvicorn")
+
+# Hashed feature space; large enough that n-gram collisions are rare
+FEATURES = 2 ** 18
+# Character n-gram sizes taken from each (space-padded) word
+NGRAM_SIZES = (3, 4, 5)
+# Filler words that say nothing about the mood itself, dropped before
+# vectorizing so "I'm feeling kinda sad" and "sad tonight" line up
+FILLER_WORDS = {
+    "a", "about", "am", "an", "and", "anything", "are", "at", "be", "bit", "film",
+    "films", "for", "feel", "feeling", "feels", "i", "i'm", "im", "in", "is", "it",
+    "just", "kind", "kinda", "like", "little", "looking", "me", "movie", "movies",
+    "my", "need", "now", "of", "on", "or", "pretty", "really", "right", "so", "some",
+    "something", "sort", "that", "the", "this", "to", "today", "tonight", "very",
+    "wanna", "want", "watch", "watching", "with"
+}
+
+
+def mood_features(mood: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Hash a mood's character n-grams into sparse sublinear term frequencies
+
+    Returns:
+        Feature indices and their 1 + log(count) weights, both empty for
+        blank moods
+    """
+    tokens = normalize_mood(mood).split()
+    tokens = [token for token in tokens if token not in FILLER_WORDS] or tokens
+    counts: Dict[int, int] = {}
+    for token in tokens:
+        padded = f" {token} "
+        for size in NGRAM_SIZES:
+            for start in range(max(1, len(padded) - size + 1)):
+                feature = zlib.crc32(padded[start:start + size].encode()) % FEATURES
+                counts[feature] = counts.get(feature, 0) + 1
+    features = np.fromiter(counts, dtype=np.int64, count=len(counts))
+    weights = 1.0 + np.log(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+    return features, weights
+
+
+class MoodIndex:
+    """
+    Nearest-neighbour lookup over previously resolved moods
+
+    Moods are embedded as TF-IDF weighted, hashed character n-grams and
+    packed into a sparse matrix sorted by feature, so a lookup scores every
+    indexed mood with one vectorized sparse product and answers from the
+    most similar one when its cosine similarity reaches `threshold`. Moods
+    with and without a negation never match each other.
+
+    Packing sorts every posting, so moods added afterwards are kept in a
+    small pending list scored row by row, and the matrix is only rebuilt
+    once that list grows past REBUILD_FRACTION of the index.
+    """
+
+    # Pending moods, relative to index size, that trigger a rebuild
+    REBUILD_FRACTION = 0.1
+    # Pending moods always tolerated before a rebuild
+    MIN_PENDING = 64
+
+    def __init__(self, threshold: float, maxsize: int):
+        """
+        Args:
+            threshold: Minimum cosine similarity for a match
+            maxsize: Moods kept; the least recently added are evicted
+        """
+        self.threshold = threshold
+        self.maxsize = maxsize
+        # normalized mood -> (features, weights, negated, genre_ids, explanation)
+        self._entries: "OrderedDict[str, Tuple[np.ndarray, np.ndarray, bool, List[int], str]]" = OrderedDict()
+        self._document_frequency = np.zeros(FEATURES, dtype=np.float32)
+        # Packed matrix (see _build) and the moods indexed since it was built
+        self._matrix: Optional[Dict] = None
+        self._pending: "OrderedDict[str, None]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.rebuilds = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, mood: str, genre_ids: List[int], explanation: str) -> None:
+        """Index the resolution of a mood"""
+        key = normalize_mood(mood)
+        features, weights = mood_features(key)
+        if not len(features):
+            return
+        if key in self._entries:
+            self._forget(key)
+        elif len(self._entries) >= self.maxsize:
+            self._forget(next(iter(self._entries)))
+
+        negated = bool(NEGATIONS.intersection(key.split()))
+        self._entries[key] = (features, weights, negated, list(genre_ids), explanation)
+        self._document_frequency[features] += 1
+        if self._matrix is not None:
+            self._pending[key] = None
+            if len(self._pending) > max(self.MIN_PENDING, self.REBUILD_FRACTION * len(self._entries)):
+                self._matrix = None
+
+    def lookup(self, mood: str) -> Optional[Dict]:
+        """
+        Find the most similar indexed mood
+
+        Returns:
+            Dict with genre_ids, explanation, the matched mood and its
+            similarity, or None when nothing is similar enough
+        """
+        key = normalize_mood(mood)
+        query_features, query_weights = mood_features(key)
+        if not len(query_features) or not self._entries:
+            self.misses += 1
+            return None
+
+        matrix = self._build()
+        idf = matrix["idf"]
+        query_weights *= idf[query_features]
+        query_weights /= np.linalg.norm(query_weights)
+        negated = bool(NEGATIONS.intersection(key.split()))
+
+        # Sparse dot product with every packed row at once: gather the
+        # postings of the query's features and sum them per row
+        postings = matrix["features"]
+        starts = np.searchsorted(postings, query_features, side="left")
+        ends = np.searchsorted(postings, query_features, side="right")
+        positions = np.concatenate([np.arange(start, end) for start, end in zip(starts, ends)])
+        similarities = np.bincount(
+            matrix["rows"][positions],
+            weights=matrix["weights"][positions] * np.repeat(query_weights, ends - starts),
+            minlength=len(matrix["keys"])
+        )
+        similarities[matrix["negated"] != negated] = -1.0
+        similarities[matrix["removed"]] = -1.0
+
+        best_key = None
+        best = -1.0
+        if len(similarities):
+            row = int(np.argmax(similarities))
+            best_key, best = matrix["keys"][row], float(similarities[row])
+
+        for pending_key in self._pending:
+            features, weights, pending_negated = self._entries[pending_key][:3]
+            if pending_negated != negated:
+                continue
+            weights = weights * idf[features]
+            _, in_query, in_row = np.intersect1d(query_features, features, assume_unique=True, return_indices=True)
+            similarity = float(query_weights[in_query] @ weights[in_row] / np.linalg.norm(weights))
+            if similarity > best:
+                best_key, best = pending_key, similarity
+
+        if best_key is None or best < self.threshold:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        genre_ids, explanation = self._entries[best_key][3:]
+        return {
+            "genre_ids": list(genre_ids),
+            "explanation": explanation,
+            "matched_mood": best_key,
+            "similarity": best
+        }
+
+    def stats(self) -> Dict:
+        """Return lookup counters and index size"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "pending": len(self._pending),
+            "rebuilds": self.rebuilds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0
+        }
+
+    async def load_history(self) -> None:
+        """Seed the index with the most recent distinct moods from History"""
+        latest = (
+            select(func.max(History.id))
+            .where(History.explanation != GeminiService.FALLBACK_EXPLANATION)
+            .group_by(History.mood)
+            .order_by(func.max(History.id).desc())
+            .limit(self.maxsize)
+        )
+        query = (
+            select(History.mood, History.genres, History.explanation)
+            .where(History.id.in_(latest))
+            .order_by(History.id)
+        )
+        try:
+            async with SessionLocal() as db:
+                rows = (await db.execute(query)).all()
+        except Exception as e:
+            logger.error(f"Mood index seed error: {type(e).__name__}: {str(e)}")
+            return
+
+        for mood, genres, explanation in rows:
+            genre_ids = [int(g) for g in genres.split(",") if g]
+            if genre_ids and explanation:
+                self.add(mood, genre_ids, explanation)
+        logger.info(f"Mood index seeded with {len(self._entries)} moods from history")
+
+    def _forget(self, key: str) -> None:
+        """Remove a mood from the index"""
+        features = self._entries.pop(key)[0]
+        self._document_frequency[features] -= 1
+        if key in self._pending:
+            del self._pending[key]
+        elif self._matrix is not None:
+            self._matrix["removed"][self._matrix["positions"][key]] = True
+
+    def _idf(self) -> np.ndarray:
+        """Smoothed inverse document frequency of every feature"""
+        count = len(self._entries)
+        return (np.log((1.0 + count) / (1.0 + self._document_frequency)) + 1.0).astype(np.float32)
+
+    def _build(self) -> Dict:
+        """
+        Pack the indexed moods into feature-sorted postings arrays
+
+        Row weights are TF-IDF weighted and L2-normalized, so a dot product
+        with a normalized query is the cosine similarity. IDF is frozen at
+        build time; moods indexed later are scored with the same weights.
+        """
+        if self._matrix is None:
+            keys = list(self._entries)
+            rows = list(self._entries.values())
+            lengths = np.fromiter((len(row[0]) for row in rows), dtype=np.int64, count=len(rows))
+            features = np.concatenate([row[0] for row in rows])
+            weights = np.concatenate([row[1] for row in rows])
+            row_ids = np.repeat(np.arange(len(rows)), lengths)
+
+            idf = self._idf()
+            weights *= idf[features]
+            norms = np.sqrt(np.bincount(row_ids, weights=weights * weights, minlength=len(rows)))
+            weights /= norms[row_ids]
+
+            order = np.argsort(features, kind="stable")
+            self._matrix = {
+                "features": features[order],
+                "rows": row_ids[order],
+                "weights": weights[order],
+                "idf": idf,
+                "negated": np.fromiter((row[2] for row in rows), dtype=bool, count=len(rows)),
+                "removed": np.zeros(len(rows), dtype=bool),
+                "keys": keys,
+                "positions": {key: position for position, key in enumerate(keys)}
+            }
+            self._pending.clear()
+            self.rebuilds += 1
+        return self._matrix
+
+
+# Process-wide mood similarity index
+mood_index = MoodIndex(
+    threshold=settings.MOOD_SIMILARITY_THRESHOLD,
+    maxsize=settings.MOOD_SIMILARITY_MAX_SIZE
+)
@@ -1,88 +1,400 @@
 """Recommendation service orchestrating Gemini and TMDB"""
+import asyncio
 import logging
-from typing import Dict
-from sqlalchemy.orm import Session
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+from .favourite_ids import favourite_ids
 from .gemini_service import GeminiService
+from .genre_fanout import GenreFanout
+from .history_writer import history_writer
+from .mood_cache import mood_cache
+from .mood_classifier import mood_classifier
+from .mood_index import mood_index
 from .tmdb_service import TMDBService
-from ..models.models import History
-from ..schemas.schemas import Movie
+from .upstream import UpstreamError
+from ..config import settings
+from ..metrics import track_stage
 
 logger = logging.getLogger("uvicorn")
 
 
 class RecommendationService:
-    """Service for orchestrating movie recommendations"""
+    """
+    Service for orchestrating movie recommendations
+    
+    Created once per process by the app lifespan, which calls startup()
+    before serving and shutdown() when stopping.
+    """
     
     def __init__(self):
         """Initialize recommendation service with AI and movie services"""
         self.gemini_service = GeminiService()
         self.tmdb_service = TMDBService()
+        self.genre_fanout = GenreFanout(self.tmdb_service)
+        self.mood_cache = mood_cache
+        self.mood_classifier = mood_classifier
+        self.mood_index = mood_index
+        self.favourite_ids = favourite_ids
+        self.history_writer = history_writer
+        # Explanations still being written after their request moved on
+        self._explanation_tasks: Set[asyncio.Task] = set()
+    
+    async def startup(self) -> None:
+        """Open pooled resources and start background work"""
+        self.tmdb_service.get_client()
+        self.history_writer.start()
+        await self.favourite_ids.load()
+        if settings.MOOD_SIMILARITY_ENABLED:
+            await self.mood_index.load_history()
+    
+    async def warm_up(self) -> None:
+        """Warm up upstream connections, without failing on errors"""
+        if settings.WARMUP_ENABLED:
+            await asyncio.gather(
+                self.gemini_service.warm_up(),
+                self.tmdb_service.warm_up()
+            )
+    
+    async def shutdown(self) -> None:
+        """Drain background work and release pooled resources"""
+        for task in self._explanation_tasks:
+            task.cancel()
+        await asyncio.gather(*self._explanation_tasks, return_exceptions=True)
+        await self.history_writer.stop()
+        await self.favourite_ids.close()
+        await self.tmdb_service.cancel_prefetches()
+        await self.tmdb_service.close_client()
+    
+    async def resolve_mood(self, mood: str) -> Dict:
+        """
+        Resolve a mood to genres via the cheapest path that can answer
+        
+        Tries the mood cache, then moods similar to earlier ones, then the
+        local classifier, then Gemini.
+        
+        Returns:
+            Dict with genre_ids, explanation and source ("cache", "similar",
+            "classifier", "gemini" or "fallback")
+        """
+        local = await self._resolve_locally(mood)
+        if local is not None:
+            return local
+        
+        ai_response = await self.gemini_service.mood_to_genres(mood)
+        if ai_response["is_fallback"]:
+            # Don't pin the generic fallback for a mood Gemini failed on
+            return {**ai_response, "source": "fallback"}
+        
+        await self._remember(mood, ai_response["genre_ids"], ai_response["explanation"])
+        return {**ai_response, "source": "gemini"}
+    
+    async def _resolve_locally(self, mood: str) -> Optional[Dict]:
+        """Resolve a mood from the mood cache, similar moods or the classifier"""
+        cached = await self.mood_cache.get(mood)
+        if cached is not None:
+            return {**cached, "source": "cache"}
+        
+        if settings.MOOD_SIMILARITY_ENABLED:
+            similar = self.mood_index.lookup(mood)
+            if similar is not None:
+                logger.info(f"Mood matched '{similar['matched_mood']}' with similarity {similar['similarity']:.2f}")
+                return {**similar, "source": "similar"}
+        
+        if settings.MOOD_CLASSIFIER_ENABLED:
+            classified = self.mood_classifier.classify(mood)
+            if classified is not None:
+                logger.info(f"Mood classified locally with confidence {classified['confidence']:.2f}")
+                return {**classified, "source": "classifier"}
+        return None
+    
+    async def _remember(self, mood: str, genre_ids: List[int], explanation: str) -> None:
+        """Keep a Gemini resolution for identical and similar moods"""
+        await self.mood_cache.set(mood, genre_ids, explanation)
+        if settings.MOOD_SIMILARITY_ENABLED:
+            self.mood_index.add(mood, genre_ids, explanation)
     
     async def get_recommendations(
         self, 
         mood: str, 
         page: int,
-        db: Session
+        cursor: Optional[str] = None,
+        exclude_favourites: bool = False
     ) -> Dict:
         """
         Get movie recommendations based on mood
         
         Process:
-        1. Convert mood to genres using Gemini AI
+        1. Convert mood to genres (mood cache, local classifier, then Gemini AI)
         2. Fetch movies from TMDB
-        3. Save search to history
+        3. Queue search for the history writer
         4. Return formatted response
         
+        With RECOMMENDATION_PIPELINE enabled, steps 1 and 2 overlap: see
+        _resolve_and_discover.
+        
         Args:
             mood: User's mood or situation
             page: Page number for pagination
-            db: Database session
+            cursor: next_cursor of the previous page, for multi-genre fan-out
+            exclude_favourites: Leave out movies that are already favourites
             
         Returns:
             Dict with explanation, movies, and pagination info
+            
+        Raises:
+            InvalidCursor: The cursor is malformed
         """
-        # Step 1: Get genres and explanation from AI
-        ai_response = await self.gemini_service.mood_to_genres(mood)
-        genre_ids = ai_response["genre_ids"]
-        explanation = ai_response["explanation"]
+        if settings.RECOMMENDATION_PIPELINE:
+            resolution, tmdb_response = await self._resolve_and_discover(mood, page, cursor)
+            genre_ids = resolution["genre_ids"]
+            explanation = resolution["explanation"]
+        else:
+            # Step 1: Get genres and explanation from cache, classifier or AI
+            resolution = await self.resolve_mood(mood)
+            genre_ids = resolution["genre_ids"]
+            explanation = resolution["explanation"]
+            
+            logger.info(f"Mood: '{mood}' -> Genres: {genre_ids} (source: {resolution['source']})")
+            
+            # Step 2: Fetch movies from TMDB
+            tmdb_response = await self._discover(genre_ids, page, cursor)
         
-        logger.info(f"Mood: '{mood}' -> Genres: {genre_ids}")
+        # Step 3: Save to history (only on first page to avoid duplicates),
+        # written in the background by the history writer
+        if page == 1 and not cursor:
+            self.history_writer.record(mood, genre_ids, explanation)
         
-        # Step 2: Fetch movies from TMDB
-        tmdb_response = await self.tmdb_service.discover_movies(
-            genre_ids=genre_ids,
-            page=page
-        )
-        
-        # Step 3: Save to history (only on first page to avoid duplicates)
-        if page == 1:
-            history_entry = History(
-                mood=mood,
-                genres=",".join(map(str, genre_ids)),
-                explanation=explanation
-            )
-            db.add(history_entry)
-            db.commit()
-        
-        # Step 4: Format movies
-        movies = [
-            Movie(
-                id=movie.get("id"),
-                title=movie.get("title", ""),
-                overview=movie.get("overview"),
-                poster_path=movie.get("poster_path"),
-                backdrop_path=movie.get("backdrop_path"),
-                vote_average=movie.get("vote_average"),
-                release_date=movie.get("release_date"),
-                genre_ids=movie.get("genre_ids", [])
-            )
-            for movie in tmdb_response["results"]
-        ]
+        # Step 4: Format movies and flag favourites
+        with track_stage("serialize"):
+            movies = self._format_movies(tmdb_response["results"])
+        movies = await self._mark_favourites(movies, exclude_favourites)
         
         return {
             "explanation": explanation,
             "page": tmdb_response["page"],
             "total_pages": tmdb_response["total_pages"],
             "total_results": tmdb_response["total_results"],
-            "movies": movies
+            "movies": movies,
+            "source": resolution["source"],
+            "next_cursor": tmdb_response.get("next_cursor")
         }
+    
+    async def _discover(self, genre_ids: List[int], page: int, cursor: Optional[str] = None) -> Dict:
+        """
+        Fetch a page of movies for the genres, prefetching the next pages
+        
+        With DISCOVER_FANOUT enabled, several genres are merged from
+        per-genre queries by GenreFanout rather than intersected.
+        """
+        if settings.DISCOVER_FANOUT and len(set(genre_ids)) > 1:
+            return await self.genre_fanout.discover(genre_ids, page=page, cursor=cursor)
+        return await self.tmdb_service.discover_movies(
+            genre_ids=genre_ids,
+            page=page,
+            prefetch=settings.TMDB_PREFETCH_PAGES
+        )
+    
+    async def _resolve_and_discover(
+        self,
+        mood: str,
+        page: int,
+        cursor: Optional[str] = None
+    ) -> Tuple[Dict, Dict]:
+        """
+        Resolve a mood and fetch its movies with the explanation off the critical path
+        
+        Moods resolved locally already have an explanation. Otherwise
+        Gemini is asked for the genres alone, and the TMDB fetch runs
+        concurrently with a second call writing the explanation. If that
+        misses EXPLANATION_DEADLINE, a templated explanation is returned,
+        and the real one is still cached for the next request.
+        
+        Returns:
+            Tuple of the resolution (as from resolve_mood) and the discover
+            response
+        """
+        local = await self._resolve_locally(mood)
+        if local is not None:
+            logger.info(f"Mood: '{mood}' -> Genres: {local['genre_ids']} (source: {local['source']})")
+            return local, await self._discover(local["genre_ids"], page, cursor)
+        
+        genres = await self.gemini_service.mood_to_genre_ids(mood)
+        genre_ids = genres["genre_ids"]
+        if genres["is_fallback"]:
+            resolution = {
+                "genre_ids": genre_ids,
+                "explanation": self.gemini_service.FALLBACK_EXPLANATION,
+                "source": "fallback"
+            }
+            return resolution, await self._discover(genre_ids, page, cursor)
+        
+        logger.info(f"Mood: '{mood}' -> Genres: {genre_ids} (source: gemini, pipelined)")
+        task = asyncio.create_task(self._explain_and_remember(mood, genre_ids))
+        self._explanation_tasks.add(task)
+        task.add_done_callback(self._explanation_tasks.discard)
+        
+        tmdb_response, explanation = await asyncio.gather(
+            self._discover(genre_ids, page, cursor),
+            self._explanation_by_deadline(task, genre_ids)
+        )
+        return {"genre_ids": genre_ids, "explanation": explanation, "source": "gemini"}, tmdb_response
+    
+    async def _explain_and_remember(self, mood: str, genre_ids: List[int]) -> Optional[str]:
+        """Have Gemini explain the genres and cache the complete resolution"""
+        explanation = await self.gemini_service.explain_genres(mood, genre_ids)
+        if explanation:
+            await self._remember(mood, genre_ids, explanation)
+        return explanation
+    
+    async def _explanation_by_deadline(self, task: asyncio.Task, genre_ids: List[int]) -> str:
+        """Wait up to EXPLANATION_DEADLINE for the explanation, then use a template"""
+        try:
+            explanation = await asyncio.wait_for(asyncio.shield(task), settings.EXPLANATION_DEADLINE)
+        except asyncio.TimeoutError:
+            logger.info(f"Explanation missed its {settings.EXPLANATION_DEADLINE}s deadline, using a template")
+            explanation = None
+        return explanation or self.mood_classifier.explain(genre_ids)
+    
+    async def stream_recommendations(
+        self,
+        mood: str,
+        page: int,
+        cursor: Optional[str] = None,
+        exclude_favourites: bool = False
+    ) -> AsyncIterator[Dict]:
+        """
+        Get movie recommendations as a stream of events
+        
+        Movies are fetched as soon as the genres are known, while Gemini is
+        still writing the explanation, and each piece is yielded the moment
+        it is ready:
+        
+        - {"type": "genres", "genre_ids", "source"}: first
+        - {"type": "explanation", "text"}: one or more explanation pieces
+        - {"type": "movies", "page", "total_pages", "total_results", "movies",
+          "next_cursor"}
+          or {"type": "error", "status", "detail", "retry_after"} if TMDB
+          is unavailable
+        - {"type": "done", "explanation", "source"}: last, with the full text
+        
+        Args:
+            mood: User's mood or situation
+            page: Page number for pagination
+            cursor: next_cursor of the previous page, for multi-genre fan-out
+            exclude_favourites: Leave out movies that are already favourites
+        """
+        events: asyncio.Queue = asyncio.Queue()
+        finished = object()
+        movie_tasks: List[asyncio.Task] = []
+        outcome: Dict = {}
+        
+        async def fetch_movies(genre_ids: List[int]) -> None:
+            try:
+                tmdb_response = await self._discover(genre_ids, page, cursor)
+                with track_stage("serialize"):
+                    movies = self._format_movies(tmdb_response["results"])
+                movies = await self._mark_favourites(movies, exclude_favourites)
+                await events.put({
+                    "type": "movies",
+                    "page": tmdb_response["page"],
+                    "total_pages": tmdb_response["total_pages"],
+                    "total_results": tmdb_response["total_results"],
+                    "movies": movies,
+                    "next_cursor": tmdb_response.get("next_cursor")
+                })
+            except UpstreamError as e:
+                await events.put({"type": "error", "status": 503, "detail": str(e), "retry_after": e.retry_after})
+            except Exception as e:
+                logger.error(f"Streaming movie fetch error: {type(e).__name__}: {str(e)}")
+                await events.put({"type": "error", "status": 500, "detail": f"Failed to get movies: {str(e)}"})
+            finally:
+                await events.put(finished)
+        
+        def genres_known(genre_ids: List[int], source: str) -> Dict:
+            movie_tasks.append(asyncio.create_task(fetch_movies(genre_ids)))
+            logger.info(f"Mood: '{mood}' -> Genres: {genre_ids} (source: {source}, streaming)")
+            return {"type": "genres", "genre_ids": genre_ids, "source": source}
+        
+        async def resolve() -> None:
+            try:
+                resolution = await self._resolve_locally(mood)
+                if resolution is not None:
+                    await events.put(genres_known(resolution["genre_ids"], resolution["source"]))
+                    await events.put({"type": "explanation", "text": resolution["explanation"]})
+                    explanation, source, genre_ids = resolution["explanation"], resolution["source"], resolution["genre_ids"]
+                else:
+                    pieces = []
+                    complete = True
+                    async for item in self.gemini_service.stream_mood_to_genres(mood):
+                        if "genre_ids" in item:
+                            genre_ids = item["genre_ids"]
+                            source = "fallback" if item["is_fallback"] else "gemini"
+                            await events.put(genres_known(genre_ids, source))
+                        elif "text" in item:
+                            pieces.append(item["text"])
+                            await events.put({"type": "explanation", "text": item["text"]})
+                        else:
+                            complete = False
+                    explanation = "".join(pieces).strip()
+                    if not explanation:
+                        explanation = self.mood_classifier.explain(genre_ids)
+                        await events.put({"type": "explanation", "text": explanation})
+                    elif source == "gemini" and complete:
+                        await self._remember(mood, genre_ids, explanation)
+                
+                if page == 1 and not cursor:
+                    self.history_writer.record(mood, genre_ids, explanation)
+                outcome.update(explanation=explanation, source=source)
+            except Exception as e:
+                logger.error(f"Streaming recommendation error: {type(e).__name__}: {str(e)}")
+                await events.put({"type": "error", "status": 500, "detail": f"Failed to get recommendations: {str(e)}"})
+            finally:
+                await events.put(finished)
+        
+        resolver = asyncio.create_task(resolve())
+        try:
+            # The resolver always finishes after starting its movie fetch,
+            # so every producer is accounted for once it is done
+            done = 0
+            while done < 1 + len(movie_tasks):
+                event = await events.get()
+                if event is finished:
+                    done += 1
+                    continue
+                yield event
+            if outcome:
+                yield {"type": "done", **outcome}
+        finally:
+            for task in [resolver, *movie_tasks]:
+                task.cancel()
+    
+    async def _mark_favourites(self, movies: List[Dict], exclude: bool) -> List[Dict]:
+        """Set is_favourite on each movie, or drop favourites when excluding them"""
+        favourites = await self.favourite_ids.find(movie["id"] for movie in movies)
+        for movie in movies:
+            movie["is_favourite"] = movie["id"] in favourites
+        if exclude:
+            movies = [movie for movie in movies if not movie["is_favourite"]]
+        return movies
+    
+    @staticmethod
+    def _format_movies(results: List[Dict]) -> List[Dict]:
+        """
+        Project TMDB result dicts onto the Movie schema's fields
+        
+        TMDB results are trusted, so they are copied into plain dicts
+        rather than validated as Movie models; the routes serialize them
+        directly.
+        """
+        return [
+            {
+                "id": movie.get("id"),
+                "title": movie.get("title") or "",
+                "overview": movie.get("overview"),
+                "poster_path": movie.get("poster_path"),
+                "backdrop_path": movie.get("backdrop_path"),
+                "vote_average": movie.get("vote_average"),
+                "release_date": movie.get("release_date"),
+                "genre_ids": movie.get("genre_ids") or []
+            }
+            for movie in results
+        ]
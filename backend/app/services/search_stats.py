@@ -0,0 +1,205 @@
+"""Genre index and hourly/daily rollups of search history for /api/stats"""
+import logging
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, insert, select, union_all
+
+from .mood_cache import normalize_mood
+from .mood_classifier import MoodClassifier
+from ..database import SessionLocal, dialect_insert
+from ..models.models import DailySearchRollup, History, HistoryGenre, HourlySearchRollup
+
+logger = logging.getLogger("uvicorn")
+
+# History rows read per query when backfilling an existing database
+BACKFILL_BATCH_SIZE = 1000
+# Rollup dimensions
+GENRE = "genre"
+MOOD = "mood"
+
+
+def parse_genres(genres: str) -> List[int]:
+    """Split a comma-separated History.genres value into genre IDs"""
+    return list(dict.fromkeys(int(g) for g in genres.split(",") if g.strip().isdigit()))
+
+
+def _utc(timestamp: datetime) -> datetime:
+    """Treat naive timestamps (as SQLite returns them) as UTC"""
+    if timestamp.tzinfo is None:
+        return timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.astimezone(timezone.utc)
+
+
+def hour_bucket(timestamp: datetime) -> datetime:
+    """Start of the UTC hour a timestamp falls in"""
+    return _utc(timestamp).replace(minute=0, second=0, microsecond=0)
+
+
+def day_bucket(timestamp: datetime) -> datetime:
+    """Start of the UTC day a timestamp falls in"""
+    return hour_bucket(timestamp).replace(hour=0)
+
+
+def _mood_key(mood: str) -> str:
+    """Key a mood is counted under, so "Happy!" and "happy" add up"""
+    return normalize_mood(mood) or mood.strip()
+
+
+def index_statements(rows: Iterable[Dict], tables: Iterable = None) -> List:
+    """
+    Build the writes that index and count a batch of History rows
+
+    Rollup counts are summed per (bucket, dimension, key) first, so each
+    rollup table gets one INSERT ... ON CONFLICT that adds to the stored
+    count and never names the same row twice.
+
+    Args:
+        rows: Dicts with the History row's id, mood, genres and created_at
+        tables: Tables to write (default: the genre index and both rollups)
+
+    Returns:
+        List of statements to execute in order, in one transaction
+    """
+    tables = set(tables or (HistoryGenre, HourlySearchRollup, DailySearchRollup))
+    genre_rows = []
+    counts = {HourlySearchRollup: Counter(), DailySearchRollup: Counter()}
+    for row in rows:
+        genre_ids = parse_genres(row["genres"])
+        created_at = _utc(row["created_at"])
+        genre_rows += [
+            {"history_id": row["id"], "genre_id": genre_id, "created_at": created_at}
+            for genre_id in genre_ids
+        ]
+        keys = [(GENRE, str(genre_id)) for genre_id in genre_ids] + [(MOOD, _mood_key(row["mood"]))]
+        for model, bucket in ((HourlySearchRollup, hour_bucket(created_at)), (DailySearchRollup, day_bucket(created_at))):
+            for dimension, key in keys:
+                counts[model][(bucket, dimension, key)] += 1
+
+    statements = []
+    if HistoryGenre in tables and genre_rows:
+        statements.append(insert(HistoryGenre).values(genre_rows))
+    for model, counter in counts.items():
+        if model not in tables or not counter:
+            continue
+        statement = dialect_insert(model.__table__).values([
+            {"bucket": bucket, "dimension": dimension, "key": key, "searches": searches}
+            for (bucket, dimension, key), searches in counter.items()
+        ])
+        statements.append(statement.on_conflict_do_update(
+            index_elements=["bucket", "dimension", "key"],
+            set_={"searches": model.__table__.c.searches + statement.excluded.searches}
+        ))
+    return statements
+
+
+def backfill(connection, existing_tables: Iterable[str]) -> None:
+    """
+    Index and count History rows written before the stats tables existed
+
+    Runs inside init_db (via run_sync) right after create_all, and only
+    fills the tables that create_all has just created, so it does its work
+    once per database.
+
+    Args:
+        connection: Synchronous connection of the init_db transaction
+        existing_tables: Table names present before create_all ran
+    """
+    existing_tables = set(existing_tables)
+    if History.__tablename__ not in existing_tables:
+        return
+    tables = [
+        model for model in (HistoryGenre, HourlySearchRollup, DailySearchRollup)
+        if model.__tablename__ not in existing_tables
+    ]
+    if not tables:
+        return
+
+    columns = (History.id, History.mood, History.genres, History.created_at)
+    last_id = 0
+    migrated = 0
+    while True:
+        rows = connection.execute(
+            select(*columns).where(History.id > last_id).order_by(History.id).limit(BACKFILL_BATCH_SIZE)
+        ).mappings().all()
+        if not rows:
+            break
+        for statement in index_statements(rows, tables):
+            connection.execute(statement)
+        last_id = rows[-1]["id"]
+        migrated += len(rows)
+    logger.info(f"Search stats backfilled from {migrated} history rows: {', '.join(m.__tablename__ for m in tables)}")
+
+
+def window_buckets(hours: int, now: Optional[datetime] = None) -> Tuple[datetime, datetime, datetime]:
+    """
+    Split the last `hours` hours into hourly and daily rollup ranges
+
+    The window starts at the beginning of its first hour. Hourly rollups
+    cover it up to the first midnight, daily rollups from there on, so a
+    window never reads more than 23 hourly buckets per key plus one per day.
+
+    Returns:
+        (since, first_day, now): hourly buckets in [since, first_day),
+        daily buckets from first_day
+    """
+    now = _utc(now or datetime.now(timezone.utc))
+    since = hour_bucket(now - timedelta(hours=hours))
+    first_day = day_bucket(since)
+    if first_day < since:
+        first_day += timedelta(days=1)
+    return since, first_day, now
+
+
+async def top_searches(hours: int, limit: int) -> Dict:
+    """
+    Return the most searched genres and moods over the last `hours` hours
+
+    Reads only the rollup tables, so the cost depends on the window and
+    the number of distinct keys, not on the size of the history.
+
+    Returns:
+        Dict with the window's since/until and `genres` and `moods`
+        lists ordered by search count
+
+    Raises:
+        SQLAlchemyError: The rollups could not be read
+    """
+    since, first_day, now = window_buckets(hours)
+    async with SessionLocal() as db:
+        genres = await _top_keys(db, GENRE, since, first_day, limit)
+        moods = await _top_keys(db, MOOD, since, first_day, limit)
+    return {
+        "hours": hours,
+        "since": since,
+        "until": now,
+        "genres": [
+            {"genre_id": int(key), "name": MoodClassifier.GENRE_NAMES.get(int(key)), "searches": searches}
+            for key, searches in genres
+        ],
+        "moods": [{"mood": key, "searches": searches} for key, searches in moods]
+    }
+
+
+async def _top_keys(db, dimension: str, since: datetime, first_day: datetime, limit: int) -> List[Tuple[str, int]]:
+    """Sum a dimension's hourly and daily rollups over the window and rank the keys"""
+    buckets = union_all(
+        select(HourlySearchRollup.key, HourlySearchRollup.searches).where(
+            HourlySearchRollup.dimension == dimension,
+            HourlySearchRollup.bucket >= since,
+            HourlySearchRollup.bucket < first_day
+        ),
+        select(DailySearchRollup.key, DailySearchRollup.searches).where(
+            DailySearchRollup.dimension == dimension,
+            DailySearchRollup.bucket >= first_day
+        )
+    ).subquery()
+    total = func.sum(buckets.c.searches)
+    query = (
+        select(buckets.c.key, total.label("searches"))
+        .group_by(buckets.c.key)
+        .order_by(total.desc(), buckets.c.key)
+        .limit(limit)
+    )
+    return [(key, int(searches)) for key, searches in (await db.execute(query)).all()]
@@ -1,8 +1,15 @@
 """TMDB API service for fetching movie data"""
+import asyncio
+import contextvars
 import httpx
 import logging
-from typing import Dict, List, Optional
+from contextlib import nullcontext
+from typing import Dict, List, Optional, Set
+from .cache import SingleFlight, TTLCache
+from .catalog_service import catalog
+from .upstream import Upstream, UpstreamError, http_retry_hint
 from ..config import settings
+from ..metrics import UPSTREAM_REQUESTS, track_stage
 
 logger = logging.getLogger("uvicorn")
 
@@ -13,25 +20,270 @@ class TMDBService:
     BASE_URL = "https://api.themoviedb.org/3"
     USER_AGENT = "FavourFlix-AI/1.0 (AI-Powered Movie Recommendation Platform)"
     
+    # Process-wide client shared by every TMDBService instance so that
+    # connections are pooled and kept alive across requests
+    _client: Optional[httpx.AsyncClient] = None
+    
+    # Process-wide response caches (one per endpoint so each has its own
+    # TTL and counters) and coalescing of identical in-flight requests
+    _caches: Dict[str, TTLCache] = {
+        "discover": TTLCache(maxsize=settings.TMDB_CACHE_MAX_SIZE, ttl=settings.TMDB_DISCOVER_CACHE_TTL),
+        "search": TTLCache(maxsize=settings.TMDB_CACHE_MAX_SIZE, ttl=settings.TMDB_SEARCH_CACHE_TTL),
+        "details": TTLCache(maxsize=settings.TMDB_CACHE_MAX_SIZE, ttl=settings.TMDB_DETAILS_CACHE_TTL)
+    }
+    _inflight = SingleFlight()
+    
+    # Background prefetches of upcoming discover pages. `_prefetched` holds
+    # cache keys fetched ahead of demand until a request consumes them, so
+    # prefetch hits can be counted.
+    _prefetch_tasks: Set[asyncio.Task] = set()
+    _prefetched: Dict[tuple, bool] = {}
+    _prefetch_stats: Dict[str, int] = {"scheduled": 0, "skipped": 0, "failed": 0, "cancelled": 0, "hits": 0}
+    
+    # Bounds upstream calls made by one or more batched detail lookups
+    _details_semaphore = asyncio.Semaphore(settings.TMDB_DETAILS_MAX_CONCURRENCY)
+    
+    # Rate limit, retries and circuit breaker shared by every TMDB call
+    _upstream = Upstream(
+        "tmdb",
+        classify=http_retry_hint,
+        rate=settings.TMDB_RATE_LIMIT,
+        burst=settings.TMDB_RATE_BURST,
+        max_retries=settings.TMDB_MAX_RETRIES,
+        backoff_base=settings.UPSTREAM_BACKOFF_BASE,
+        backoff_max=settings.UPSTREAM_BACKOFF_MAX,
+        max_wait=settings.UPSTREAM_MAX_WAIT,
+        failure_threshold=settings.UPSTREAM_FAILURE_THRESHOLD,
+        reset_timeout=settings.UPSTREAM_RESET_TIMEOUT
+    )
+    
     def __init__(self):
         """Initialize TMDB service"""
         self.api_key = settings.TMDB_API_KEY
     
-    def _create_client(self) -> httpx.AsyncClient:
-        """Create a new HTTP client"""
-        timeout = httpx.Timeout(30.0, connect=15.0)
+    @classmethod
+    def get_client(cls) -> httpx.AsyncClient:
+        """Return the shared HTTP client, creating it on first use"""
+        if cls._client is None or cls._client.is_closed:
+            cls._client = cls._build_client()
+        return cls._client
+    
+    @classmethod
+    def _build_client(cls) -> httpx.AsyncClient:
+        """Build the pooled HTTP client from settings"""
+        http2 = settings.TMDB_HTTP2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("TMDB_HTTP2 is enabled but the 'h2' package is not installed; falling back to HTTP/1.1")
+                http2 = False
+        
+        timeout = httpx.Timeout(settings.TMDB_TIMEOUT, connect=settings.TMDB_CONNECT_TIMEOUT)
+        limits = httpx.Limits(
+            max_connections=settings.TMDB_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.TMDB_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.TMDB_KEEPALIVE_EXPIRY
+        )
+        logger.info(f"Creating TMDB HTTP client: max_connections={limits.max_connections}, http2={http2}")
         return httpx.AsyncClient(
             timeout=timeout,
+            limits=limits,
             follow_redirects=True,
-            http2=False,
-            headers={"User-Agent": self.USER_AGENT}
+            http2=http2,
+            headers={"User-Agent": cls.USER_AGENT}
+        )
+    
+    async def warm_up(self) -> None:
+        """Open a pooled connection to TMDB ahead of the first request"""
+        try:
+            response = await self.get_client().get(
+                f"{self.BASE_URL}/configuration",
+                params={"api_key": self.api_key},
+                timeout=settings.WARMUP_TIMEOUT
+            )
+            response.raise_for_status()
+        except Exception as e:
+            logger.warning(f"TMDB warm-up failed: {type(e).__name__}: {str(e)}")
+    
+    @classmethod
+    async def close_client(cls) -> None:
+        """Close the shared HTTP client and release pooled connections"""
+        if cls._client is not None:
+            await cls._client.aclose()
+            cls._client = None
+    
+    @staticmethod
+    def _cache_key(path: str, params: Dict) -> tuple:
+        """Build the response cache key for a request"""
+        return (path, tuple(sorted(params.items())))
+    
+    async def _get(self, endpoint: str, path: str, params: Dict, prefetch: bool = False) -> Dict:
+        """
+        GET a TMDB endpoint through the response cache
+        
+        Concurrent identical requests share one upstream call, made under
+        the TMDB rate limit and circuit breaker and retried on 429, 5xx and
+        network errors. Only successful responses are cached; errors
+        propagate to the caller. Returned data is shared between callers
+        and must not be mutated.
+        
+        Args:
+            endpoint: Cache name ("discover", "search" or "details")
+            path: API path relative to BASE_URL
+            params: Query parameters, excluding the API key
+            prefetch: Request is a background prefetch, not user demand
+            
+        Returns:
+            Decoded JSON response
+            
+        Raises:
+            UpstreamError: TMDB is unavailable or over quota
+            httpx.HTTPStatusError: TMDB rejected the request (e.g. 404)
+        """
+        cache = self._caches[endpoint]
+        key = self._cache_key(path, params)
+        if not prefetch and self._prefetched.pop(key, False):
+            self._prefetch_stats["hits"] += 1
+        
+        data = cache.get(key)
+        if data is not None:
+            return data
+        
+        async def attempt() -> httpx.Response:
+            try:
+                response = await self.get_client().get(
+                    f"{self.BASE_URL}{path}",
+                    params={**params, "api_key": self.api_key}
+                )
+            except Exception as e:
+                UPSTREAM_REQUESTS.inc(upstream="tmdb", outcome=type(e).__name__)
+                raise
+            UPSTREAM_REQUESTS.inc(upstream="tmdb", outcome=str(response.status_code))
+            response.raise_for_status()
+            return response
+        
+        async def fetch() -> Dict:
+            # Prefetches run in the background, so their time is not part
+            # of any request's TMDB stage
+            with nullcontext() if prefetch else track_stage("tmdb"):
+                # Prefetches are speculative, so they are never retried
+                response = await self._upstream.call(attempt, retries=0 if prefetch else None)
+            data = response.json()
+            if cache.ttl > 0:
+                cache.set(key, data)
+            return data
+        
+        return await self._inflight.do(key, fetch)
+    
+    @classmethod
+    def cache_stats(cls) -> Dict:
+        """Return hit/miss counters for each response cache"""
+        stats = {name: cache.stats() for name, cache in cls._caches.items()}
+        stats["coalesced"] = cls._inflight.coalesced
+        prefetch_stats = dict(cls._prefetch_stats)
+        prefetch_stats["in_flight"] = len(cls._prefetch_tasks)
+        completed = (
+            prefetch_stats["scheduled"] - prefetch_stats["in_flight"]
+            - prefetch_stats["failed"] - prefetch_stats["cancelled"]
         )
+        prefetch_stats["hit_ratio"] = prefetch_stats["hits"] / completed if completed > 0 else 0.0
+        stats["prefetch"] = prefetch_stats
+        return stats
+    
+    def prefetch_discover(
+        self,
+        genre_ids: List[int],
+        page: int,
+        total_pages: int,
+        sort_by: str = "popularity.desc",
+        depth: int = 1
+    ) -> None:
+        """
+        Fetch the discover pages after `page` into the response cache
+        
+        Runs in the background without delaying the caller. Pages already
+        cached are skipped, and nothing new is scheduled while
+        TMDB_PREFETCH_MAX_CONCURRENCY prefetches are running or the TMDB
+        rate limit has no spare tokens.
+        
+        Args:
+            genre_ids: List of TMDB genre IDs
+            page: Page just served
+            total_pages: Total pages reported for the query
+            sort_by: Sort method used for the served page
+            depth: Number of following pages to fetch
+        """
+        if self._caches["discover"].ttl <= 0:
+            return
+        
+        for next_page in range(page + 1, min(page + depth, total_pages) + 1):
+            params = self._discover_params(genre_ids, next_page, sort_by)
+            key = self._cache_key("/discover/movie", params)
+            if key in self._caches["discover"] or key in self._prefetched:
+                continue
+            if (
+                len(self._prefetch_tasks) >= settings.TMDB_PREFETCH_MAX_CONCURRENCY
+                or self._upstream.bucket.tokens() < 1
+                or self._upstream.breaker.state != self._upstream.breaker.CLOSED
+            ):
+                self._prefetch_stats["skipped"] += 1
+                continue
+            
+            # Bound how many unconsumed prefetches are remembered
+            if len(self._prefetched) >= settings.TMDB_CACHE_MAX_SIZE:
+                self._prefetched.pop(next(iter(self._prefetched)))
+            self._prefetched[key] = True
+            self._prefetch_stats["scheduled"] += 1
+            # A fresh context, so the prefetch is not attributed to the
+            # request that scheduled it (e.g. in its Server-Timing header)
+            task = asyncio.create_task(self._prefetch(key, params), context=contextvars.Context())
+            self._prefetch_tasks.add(task)
+            task.add_done_callback(lambda done, key=key: self._prefetch_done(done, key))
+    
+    async def _prefetch(self, key: tuple, params: Dict) -> None:
+        """Fetch one discover page for the cache, dropping errors"""
+        try:
+            await self._get("discover", "/discover/movie", params, prefetch=True)
+        except Exception as e:
+            self._prefetched.pop(key, None)
+            self._prefetch_stats["failed"] += 1
+            logger.warning(f"TMDB prefetch failed for page {params['page']}: {type(e).__name__}: {str(e)}")
+    
+    @classmethod
+    def _prefetch_done(cls, task: asyncio.Task, key: tuple) -> None:
+        """Forget a finished prefetch task, accounting for cancellation"""
+        cls._prefetch_tasks.discard(task)
+        if task.cancelled():
+            cls._prefetched.pop(key, None)
+            cls._prefetch_stats["cancelled"] += 1
+    
+    @classmethod
+    async def cancel_prefetches(cls) -> None:
+        """Cancel every running prefetch and wait for them to finish"""
+        tasks = list(cls._prefetch_tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        cls._prefetch_tasks.clear()
+    
+    @staticmethod
+    def _discover_params(genre_ids: List[int], page: int, sort_by: str) -> Dict:
+        """Build discover query parameters, excluding the API key"""
+        return {
+            "with_genres": ",".join(map(str, genre_ids)),
+            "sort_by": sort_by,
+            "page": page,
+            "vote_count.gte": 100,  # Filter for movies with at least 100 votes
+            "language": "en-US"
+        }
     
     async def discover_movies(
         self, 
         genre_ids: List[int], 
         page: int = 1,
-        sort_by: str = "popularity.desc"
+        sort_by: str = "popularity.desc",
+        prefetch: int = 0
     ) -> Dict:
         """
         Discover movies by genre with pagination
@@ -40,52 +292,81 @@ class TMDBService:
             genre_ids: List of TMDB genre IDs
             page: Page number for pagination (default: 1)
             sort_by: Sort method (default: popularity.desc)
+            prefetch: Number of following pages to fetch into the cache in
+                the background (default: 0, no prefetch)
             
         Returns:
             Dict with movies, page info, and metadata
+            
+        Raises:
+            UpstreamError: TMDB is unavailable or over quota and the catalog
+                mirror cannot stand in
         """
-        # Convert genre IDs to comma-separated string
         genres_str = ",".join(map(str, genre_ids))
         
-        url = f"{self.BASE_URL}/discover/movie"
-        params = {
-            "api_key": self.api_key,
-            "with_genres": genres_str,
-            "sort_by": sort_by,
-            "page": page,
-            "vote_count.gte": 100,  # Filter for movies with at least 100 votes
-            "language": "en-US"
-        }
+        # Answer from the local catalog mirror when it covers this query
+        use_catalog = settings.CATALOG_ENABLED and sort_by == "popularity.desc"
+        if use_catalog:
+            local = await self._catalog_discover(genre_ids, page)
+            if local is not None:
+                logger.info(f"TMDB discover served from catalog: genres={genres_str}, page={page}")
+                return local
         
-        client = self._create_client()
         try:
             logger.info(f"TMDB discover request: genres={genres_str}, page={page}, sort={sort_by}")
-            response = await client.get(url, params=params)
-            response.raise_for_status()
-            data = response.json()
+            data = await self.fetch_discover(genre_ids, page, sort_by)
             logger.info(f"TMDB discover response: {len(data.get('results', []))} movies, total_results={data.get('total_results', 0)}")
             
+            total_pages = min(data.get("total_pages", 1), 500)
+            if prefetch > 0:
+                self.prefetch_discover(genre_ids, page, total_pages, sort_by, depth=prefetch)
+            
             return {
                 "results": data.get("results", []),
                 "page": data.get("page", 1),
-                "total_pages": min(data.get("total_pages", 1), 500),
+                "total_pages": total_pages,
                 "total_results": data.get("total_results", 0)
             }
                 
+        except UpstreamError as e:
+            logger.error(f"TMDB unavailable: {str(e)}")
+            # Serve whatever the mirror has, even if stale, before giving up
+            if use_catalog:
+                local = await self._catalog_discover(genre_ids, page, allow_stale=True)
+                if local is not None:
+                    logger.info(f"TMDB discover served from stale catalog: genres={genres_str}, page={page}")
+                    return local
+            raise
         except httpx.HTTPStatusError as e:
             logger.error(f"TMDB HTTP error {e.response.status_code}: {e.response.text}")
-            return self._empty_response()
-        except httpx.ConnectError as e:
-            logger.error(f"TMDB connection error: {type(e).__name__} - {str(e)}")
-            return self._empty_response()
-        except httpx.TimeoutException as e:
-            logger.error(f"TMDB timeout error: {str(e)}")
-            return self._empty_response()
         except Exception as e:
             logger.error(f"TMDB error: {type(e).__name__}: {str(e)}")
-            return self._empty_response()
-        finally:
-            await client.aclose()
+        
+        return self._empty_response()
+    
+    async def fetch_discover(
+        self,
+        genre_ids: List[int],
+        page: int = 1,
+        sort_by: str = "popularity.desc"
+    ) -> Dict:
+        """
+        Fetch a raw discover page from TMDB through the response cache
+        
+        Unlike discover_movies, errors are raised and the catalog mirror
+        is not consulted.
+        """
+        params = self._discover_params(genre_ids, page, sort_by)
+        return await self._get("discover", "/discover/movie", params)
+    
+    @staticmethod
+    async def _catalog_discover(genre_ids: List[int], page: int, allow_stale: bool = False) -> Optional[Dict]:
+        """Look up a discover page in the catalog mirror, treating errors as misses"""
+        try:
+            return await catalog.discover(genre_ids, page, allow_stale=allow_stale)
+        except Exception as e:
+            logger.error(f"Catalog lookup error: {type(e).__name__}: {str(e)}")
+            return None
     
     async def get_movie_details(self, movie_id: int) -> Optional[Dict]:
         """
@@ -96,24 +377,66 @@ class TMDBService:
             
         Returns:
             Dict with movie details or None if not found
+            
+        Raises:
+            UpstreamError: TMDB is unavailable or over quota
         """
-        url = f"{self.BASE_URL}/movie/{movie_id}"
         params = {
-            "api_key": self.api_key,
             "language": "en-US"
         }
         
-        client = self._create_client()
         try:
-            response = await client.get(url, params=params)
-            response.raise_for_status()
-            return response.json()
+            return await self._get("details", f"/movie/{movie_id}", params)
                 
         except httpx.HTTPError as e:
             logger.error(f"TMDB movie details error: {str(e)}")
             return None
-        finally:
-            await client.aclose()
+    
+    async def get_movie_details_many(self, movie_ids: List[int]) -> Dict:
+        """
+        Get details for several movies concurrently
+        
+        Cached movies are answered immediately; the rest are fetched in
+        parallel, at most TMDB_DETAILS_MAX_CONCURRENCY at a time. A failed
+        lookup does not fail the batch but is reported in "errors".
+        
+        Args:
+            movie_ids: TMDB movie IDs (duplicates are fetched once)
+            
+        Returns:
+            Dict with "movies" (details in request order) and "errors"
+            (one {"id", "error"} entry per movie that could not be fetched)
+        """
+        params = {
+            "language": "en-US"
+        }
+        details_cache = self._caches["details"]
+        
+        async def fetch(movie_id: int) -> Dict:
+            path = f"/movie/{movie_id}"
+            if self._cache_key(path, params) in details_cache:
+                return await self._get("details", path, params)
+            async with self._details_semaphore:
+                return await self._get("details", path, params)
+        
+        unique_ids = list(dict.fromkeys(movie_ids))
+        results = await asyncio.gather(*(fetch(movie_id) for movie_id in unique_ids), return_exceptions=True)
+        
+        movies = []
+        errors = []
+        for movie_id, result in zip(unique_ids, results):
+            if not isinstance(result, BaseException):
+                movies.append(result)
+            elif isinstance(result, httpx.HTTPStatusError) and result.response.status_code == 404:
+                errors.append({"id": movie_id, "error": "not_found"})
+            elif isinstance(result, httpx.HTTPStatusError):
+                errors.append({"id": movie_id, "error": f"http_{result.response.status_code}"})
+            else:
+                errors.append({"id": movie_id, "error": type(result).__name__})
+        
+        if errors:
+            logger.warning(f"TMDB batch details: {len(errors)} of {len(unique_ids)} movies failed")
+        return {"movies": movies, "errors": errors}
     
     async def search_movies(self, query: str, page: int = 1) -> Dict:
         """
@@ -125,20 +448,18 @@ class TMDBService:
             
         Returns:
             Dict with search results and pagination info
+            
+        Raises:
+            UpstreamError: TMDB is unavailable or over quota
         """
-        url = f"{self.BASE_URL}/search/movie"
         params = {
-            "api_key": self.api_key,
             "query": query,
             "page": page,
             "language": "en-US"
         }
         
-        client = self._create_client()
         try:
-            response = await client.get(url, params=params)
-            response.raise_for_status()
-            data = response.json()
+            data = await self._get("search", "/search/movie", params)
             
             return {
                 "results": data.get("results", []),
@@ -150,8 +471,6 @@ class TMDBService:
         except httpx.HTTPError as e:
             logger.error(f"TMDB search error: {str(e)}")
             return self._empty_response()
-        finally:
-            await client.aclose()
     
     @staticmethod
     def _empty_response() -> Dict:
@@ -0,0 +1,379 @@
+"""Rate limiting, retries and circuit breaking for upstream API calls"""
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional, TypeVar
+
+import httpx
+
+logger = logging.getLogger("uvicorn")
+
+T = TypeVar("T")
+
+# Lowest share of the configured quota a throttled token bucket slows to
+MIN_RATE_FRACTION = 0.1
+# Share of the configured quota a throttled bucket regains per success
+RECOVERY_FRACTION = 0.05
+
+
+class UpstreamError(Exception):
+    """
+    An upstream API is unavailable or over quota
+
+    Attributes:
+        upstream: Upstream name ("tmdb" or "gemini")
+        retry_after: Seconds after which a retry may succeed, when known
+    """
+
+    def __init__(self, upstream: str, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(UpstreamError):
+    """Raised without calling an upstream whose circuit breaker is open"""
+
+
+class RateLimitedError(UpstreamError):
+    """Raised when no rate limit token is available within the allowed wait"""
+
+
+class RetryHint(NamedTuple):
+    """How a failed call should be retried"""
+    # The upstream reported we exceeded its quota
+    throttled: bool = False
+    # Seconds the upstream asked us to wait (Retry-After)
+    retry_after: Optional[float] = None
+
+
+# Decides whether an exception is a retryable upstream failure; returns
+# None for errors that retrying cannot fix (e.g. 404)
+Classifier = Callable[[Exception], Optional[RetryHint]]
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given in seconds or as an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def http_retry_hint(error: Exception) -> Optional[RetryHint]:
+    """Classify httpx errors: 429, 5xx, timeouts and connection errors are retryable"""
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        if status == 429 or status >= 500:
+            return RetryHint(
+                throttled=status == 429,
+                retry_after=parse_retry_after(error.response.headers.get("Retry-After"))
+            )
+        return None
+    if isinstance(error, (httpx.TransportError, asyncio.TimeoutError)):
+        return RetryHint()
+    return None
+
+
+def _describe(error: Exception) -> str:
+    """Name an upstream error without its message"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return f"HTTP {error.response.status_code}"
+    return type(error).__name__
+
+
+class TokenBucket:
+    """
+    Token bucket spacing calls to an upstream's request quota
+
+    Each call reserves a token and sleeps until it is due, so bursts are
+    queued at the configured rate rather than sent at once and rejected.
+    When the upstream reports throttling the rate is halved, and it creeps
+    back to the configured quota with each successful call.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        """
+        Args:
+            rate: Sustained requests per second
+            burst: Requests that may be sent back to back
+        """
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    def _refill(self) -> float:
+        """Add the tokens earned since the last update and return the current time"""
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        return now
+
+    def tokens(self) -> float:
+        """Return the tokens currently available (negative when calls are queued)"""
+        self._refill()
+        return self._tokens
+
+    def wait_time(self) -> float:
+        """Return how long a call made now would wait for its token"""
+        now = self._refill()
+        return max(0.0, (1.0 - self._tokens) / self.rate, self._paused_until - now)
+
+    async def acquire(self, max_wait: float) -> bool:
+        """
+        Take a token, sleeping until it is due
+
+        Returns:
+            False without taking a token if it would take longer than
+            max_wait seconds
+        """
+        wait = self.wait_time()
+        if wait > max_wait:
+            return False
+        self._tokens -= 1.0
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return True
+
+    def pause(self, seconds: float) -> None:
+        """Hold every call for the given time (e.g. a Retry-After)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def slow_down(self) -> None:
+        """Halve the rate after the upstream reported throttling"""
+        self._refill()
+        self.rate = max(self.max_rate * MIN_RATE_FRACTION, self.rate / 2)
+
+    def recover(self) -> None:
+        """Move the rate back towards the configured quota after a success"""
+        if self.rate < self.max_rate:
+            self._refill()
+            self.rate = min(self.max_rate, self.rate + self.max_rate * RECOVERY_FRACTION)
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker that fails fast while an upstream is down
+
+    Opens after `failure_threshold` consecutive failures. Once
+    `reset_timeout` seconds have passed a single probe call is let
+    through: success closes the circuit, failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        """
+        Args:
+            failure_threshold: Consecutive failures that open the circuit
+            reset_timeout: Seconds to stay open before probing
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opens = 0
+        self._opened_at = 0.0
+        self._probe_started: Optional[float] = None
+
+    def retry_in(self) -> float:
+        """Return seconds until an open circuit lets a probe through"""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+
+    def rejects(self) -> bool:
+        """Return True while the circuit is open and not yet due for a probe"""
+        return self.state == self.OPEN and self.retry_in() > 0
+
+    def allow(self) -> bool:
+        """Return True if a call may be made now"""
+        if self.state == self.CLOSED:
+            return True
+        if self.rejects():
+            return False
+        now = time.monotonic()
+        # Let one probe through; a probe that never reported back (e.g.
+        # cancelled) is replaced after reset_timeout
+        if self._probe_started is not None and now - self._probe_started < self.reset_timeout:
+            return False
+        self.state = self.HALF_OPEN
+        self._probe_started = now
+        return True
+
+    def record_success(self) -> None:
+        """Close the circuit after a call the upstream answered"""
+        if self.state != self.CLOSED:
+            logger.info("Circuit closed, upstream recovered")
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_started = None
+
+    def record_failure(self) -> None:
+        """Count a failed call, opening the circuit at the threshold"""
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.opens += 1
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+            self._probe_started = None
+
+
+class Upstream:
+    """
+    Shared policy for calling one upstream API
+
+    Every call waits for a rate limit token, is rejected immediately while
+    the circuit breaker is open, and is retried with jittered exponential
+    backoff when the classifier reports a retryable failure. A Retry-After
+    from the upstream pauses all calls, not just the one that received it.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        classify: Classifier,
+        rate: float,
+        burst: int,
+        max_retries: int,
+        backoff_base: float,
+        backoff_max: float,
+        max_wait: float,
+        failure_threshold: int,
+        reset_timeout: float
+    ):
+        """
+        Args:
+            name: Upstream name used in logs, errors and metrics
+            classify: Decides which exceptions are retryable upstream failures
+            rate: Sustained requests per second allowed by the quota
+            burst: Requests that may be sent back to back
+            max_retries: Retries after the first attempt
+            backoff_base: Backoff ceiling of the first retry, in seconds
+            backoff_max: Largest backoff ceiling, in seconds
+            max_wait: Longest a call may wait for a rate limit token
+            failure_threshold: Consecutive failures that open the circuit
+            reset_timeout: Seconds the circuit stays open before probing
+        """
+        self.name = name
+        self.classify = classify
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_wait = max_wait
+        self.counts: Dict[str, int] = {"retries": 0, "exhausted": 0, "circuit_open": 0, "rate_limited": 0}
+        upstreams[name] = self
+
+    def backoff(self, attempt: int) -> float:
+        """Return a full-jitter backoff delay for the given retry number"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def call(
+        self,
+        fn: Callable[[], Awaitable[T]],
+        retries: Optional[int] = None,
+        max_wait: Optional[float] = None
+    ) -> T:
+        """
+        Call the upstream under the rate limit, circuit breaker and retries
+
+        Args:
+            fn: Makes one attempt; called again for each retry
+            retries: Override max_retries (e.g. 0 for background work)
+            max_wait: Override the longest wait for a rate limit token
+
+        Returns:
+            The result of the first successful attempt
+
+        Raises:
+            CircuitOpenError: The circuit is open
+            RateLimitedError: No token was available within max_wait
+            UpstreamError: Retryable failures persisted through every retry
+            Exception: Non-retryable errors from fn, unchanged
+        """
+        retries = self.max_retries if retries is None else retries
+        max_wait = self.max_wait if max_wait is None else max_wait
+        attempt = 0
+        while True:
+            if self.breaker.rejects():
+                self.counts["circuit_open"] += 1
+                raise CircuitOpenError(self.name, f"{self.name} is unavailable (circuit open)", self.breaker.retry_in())
+            if not await self.bucket.acquire(max_wait):
+                self.counts["rate_limited"] += 1
+                raise RateLimitedError(self.name, f"{self.name} rate limit exceeded", self.bucket.wait_time())
+            if not self.breaker.allow():
+                self.counts["circuit_open"] += 1
+                raise CircuitOpenError(self.name, f"{self.name} is unavailable (circuit open)", self.breaker.reset_timeout)
+
+            try:
+                result = await fn()
+            except Exception as e:
+                hint = self.classify(e)
+                if hint is None:
+                    # The upstream answered; the request itself was at fault
+                    self.breaker.record_success()
+                    raise
+
+                self.breaker.record_failure()
+                if hint.throttled:
+                    self.bucket.slow_down()
+                if hint.retry_after:
+                    self.bucket.pause(hint.retry_after)
+
+                if attempt >= retries or (hint.retry_after or 0) > max_wait:
+                    self.counts["exhausted"] += 1
+                    # Summarize rather than echo the error, whose message can
+                    # include request URLs and credentials
+                    raise UpstreamError(
+                        self.name,
+                        f"{self.name} failed after {attempt + 1} attempt(s): {_describe(e)}",
+                        hint.retry_after
+                    ) from e
+
+                delay = self.backoff(attempt)
+                attempt += 1
+                self.counts["retries"] += 1
+                logger.warning(
+                    f"{self.name} call failed ({type(e).__name__}), retry {attempt}/{retries} in {delay:.2f}s"
+                )
+                await asyncio.sleep(delay)
+                continue
+
+            self.breaker.record_success()
+            self.bucket.recover()
+            return result
+
+    def stats(self) -> Dict:
+        """Return limiter, breaker and retry state"""
+        return {
+            **self.counts,
+            "circuit_state": self.breaker.state,
+            "circuit_opens": self.breaker.opens,
+            "consecutive_failures": self.breaker.failures,
+            "rate": self.bucket.rate,
+            "tokens": self.bucket.tokens()
+        }
+
+
+# Every Upstream created, by name, for metrics
+upstreams: Dict[str, Upstream] = {}
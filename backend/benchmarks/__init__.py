@@ -0,0 +1 @@
+"""Benchmark harness with local stand-ins for TMDB and Gemini"""
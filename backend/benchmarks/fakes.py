@@ -0,0 +1,235 @@
+"""Local stand-ins for the TMDB and Gemini APIs with tunable latency and errors"""
+import asyncio
+import json
+import random
+import re
+import zlib
+from typing import Dict, List
+
+import httpx
+from google.api_core import exceptions as google_exceptions
+
+from app.services.gemini_service import GeminiService
+
+# Genre names the fake model picks from (one name per TMDB genre ID)
+GENRE_NAMES = [name for name in GeminiService.GENRE_MAP if name != "sci-fi"]
+
+
+class Behaviour:
+    """
+    Latency and failure profile of a fake upstream
+
+    Args:
+        latency: Mean seconds each call takes
+        jitter: Latency spread, as a fraction of latency (uniform)
+        error_rate: Share of calls that fail with a retryable error
+        seed: Seed for reproducible latencies and failures
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.calls = 0
+        self.errors = 0
+
+    async def delay(self) -> None:
+        """Sleep for one call's latency"""
+        seconds = self.latency * (1 + self.random.uniform(-self.jitter, self.jitter))
+        if seconds > 0:
+            await asyncio.sleep(seconds)
+
+    def should_fail(self) -> bool:
+        """Count a call and decide whether it fails"""
+        self.calls += 1
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.errors += 1
+            return True
+        return False
+
+    def stats(self) -> Dict:
+        """Return call and error counts"""
+        return {"calls": self.calls, "errors": self.errors}
+
+
+class FakeTMDB:
+    """
+    TMDB API served from a deterministic synthetic catalog
+
+    Use as an httpx.MockTransport handler. Discover honors with_genres (AND
+    semantics), popularity order and vote_count.gte like TMDB; failing
+    calls answer 503.
+    """
+
+    PAGE_SIZE = 20
+
+    def __init__(self, behaviour: Behaviour, catalog_size: int = 5000, seed: int = 0):
+        self.behaviour = behaviour
+        rng = random.Random(seed)
+        genre_ids = sorted(set(GeminiService.GENRE_MAP.values()))
+        self.movies = [
+            {
+                "id": movie_id,
+                "title": f"Benchmark Movie {movie_id}",
+                "overview": f"Synthetic overview of movie {movie_id}. " * 4,
+                "poster_path": f"/poster{movie_id}.jpg",
+                "backdrop_path": f"/backdrop{movie_id}.jpg",
+                "vote_average": round(rng.uniform(4.0, 9.0), 1),
+                "vote_count": rng.randint(50, 20000),
+                "popularity": round(rng.paretovariate(1.5) * 10, 3),
+                "release_date": f"{rng.randint(1970, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                "genre_ids": rng.sample(genre_ids, rng.randint(1, 3))
+            }
+            for movie_id in range(1, catalog_size + 1)
+        ]
+        self.movies.sort(key=lambda movie: -movie["popularity"])
+        self.by_id = {movie["id"]: movie for movie in self.movies}
+
+    def transport(self) -> httpx.MockTransport:
+        """Return an httpx transport answering from this fake"""
+        return httpx.MockTransport(self.handle)
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        await self.behaviour.delay()
+        if self.behaviour.should_fail():
+            return httpx.Response(503, json={"status_message": "Service unavailable (fake)"})
+
+        path = request.url.path.removeprefix("/3")
+        params = request.url.params
+        if path == "/configuration":
+            return httpx.Response(200, json={"images": {}})
+        if path == "/discover/movie":
+            wanted = {int(g) for g in params.get("with_genres", "").split(",") if g}
+            min_votes = int(params.get("vote_count.gte", 0))
+            matches = [
+                movie for movie in self.movies
+                if wanted.issubset(movie["genre_ids"]) and movie["vote_count"] >= min_votes
+            ]
+            return httpx.Response(200, json=self._page(matches, int(params.get("page", 1))))
+        if path == "/search/movie":
+            query = params.get("query", "").lower()
+            matches = [movie for movie in self.movies if query in movie["title"].lower()]
+            return httpx.Response(200, json=self._page(matches, int(params.get("page", 1))))
+        match = re.fullmatch(r"/movie/(\d+)", path)
+        if match and int(match.group(1)) in self.by_id:
+            movie = self.by_id[int(match.group(1))]
+            return httpx.Response(200, json={
+                **movie,
+                "genres": [{"id": genre_id, "name": str(genre_id)} for genre_id in movie["genre_ids"]],
+                "runtime": 100 + movie["id"] % 60,
+                "status": "Released"
+            })
+        return httpx.Response(404, json={"status_message": "Not found (fake)"})
+
+    def _page(self, matches: List[Dict], page: int) -> Dict:
+        """Slice one discover/search page out of the matches"""
+        start = (page - 1) * self.PAGE_SIZE
+        return {
+            "results": matches[start:start + self.PAGE_SIZE],
+            "page": page,
+            "total_pages": max(1, min(500, -(-len(matches) // self.PAGE_SIZE))),
+            "total_results": len(matches)
+        }
+
+
+class _Text:
+    """Minimal stand-in for a Gemini response or stream chunk"""
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+class _Stream:
+    """Async iterator over streamed chunks, spreading the latency across them"""
+
+    def __init__(self, chunks: List[str], behaviour: Behaviour):
+        self.chunks = chunks
+        self.behaviour = behaviour
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for chunk in self.chunks:
+            await asyncio.sleep(self.behaviour.latency / (2 * len(self.chunks)))
+            yield _Text(chunk)
+
+
+class FakeGemini:
+    """
+    Stand-in for genai.GenerativeModel answering every prompt the app sends
+
+    Genres are derived from a hash of the mood, so repeated moods resolve
+    identically. Failing calls raise ServiceUnavailable, which the Gemini
+    upstream policy retries.
+    """
+
+    def __init__(self, behaviour: Behaviour):
+        self.behaviour = behaviour
+
+    async def count_tokens_async(self, contents):
+        await self.behaviour.delay()
+        return {"total_tokens": len(str(contents).split())}
+
+    async def generate_content_async(self, prompt: str, stream: bool = False, generation_config=None):
+        if stream:
+            # Time to the first chunk; the rest arrives while iterating
+            await asyncio.sleep(self.behaviour.latency / 2)
+        else:
+            await self.behaviour.delay()
+        if self.behaviour.should_fail():
+            raise google_exceptions.ServiceUnavailable("Fake Gemini unavailable")
+
+        genres = [self._genres(mood) for mood in self._moods(prompt)]
+        explanation = "These genres suit the mood you described. Enjoy the picks!"
+        if "GENRES:" in prompt:
+            text = f"GENRES: {', '.join(genres[0])}\n{explanation}"
+            if stream:
+                return _Stream([text[:len(text) // 2], text[len(text) // 2:]], self.behaviour)
+            return _Text(text)
+        if "ONLY the genre names" in prompt:
+            return _Text(", ".join(genres[0]))
+        if "explanation only" in prompt:
+            return _Text(explanation)
+        if "JSON array" in prompt:
+            return _Text(json.dumps([
+                {"id": number, "genres": names, "explanation": explanation}
+                for number, names in enumerate(genres, 1)
+            ]))
+        return _Text(json.dumps({"genres": genres[0], "explanation": explanation}))
+
+    @staticmethod
+    def _moods(prompt: str) -> List[str]:
+        """Extract the mood(s) a prompt asks about"""
+        numbered = re.findall(r'^\d+\. (".*")$', prompt, flags=re.MULTILINE)
+        if numbered:
+            return [json.loads(mood) for mood in numbered]
+        moods = re.findall(r'mood[^"\n]*:\s*"([^"]*)"', prompt)
+        return moods or [prompt]
+
+    @staticmethod
+    def _genres(mood: str) -> List[str]:
+        """Pick 1-3 genres deterministically from the mood"""
+        rng = random.Random(zlib.crc32(mood.encode()))
+        return rng.sample(GENRE_NAMES, rng.randint(1, 3))
+
+
+def make_fakes(
+    tmdb_latency: float,
+    gemini_latency: float,
+    error_rate: float,
+    jitter: float = 0.25,
+    seed: int = 0,
+    catalog_size: int = 5000
+) -> Dict:
+    """Build the fake upstreams used by a benchmark run"""
+    return {
+        "tmdb": FakeTMDB(Behaviour(tmdb_latency, jitter, error_rate, seed), catalog_size=catalog_size, seed=seed),
+        "gemini": FakeGemini(Behaviour(gemini_latency, jitter, error_rate, seed + 1))
+    }
+
+
+def upstream_stats(fakes: Dict) -> Dict[str, Dict]:
+    """Return call counts of each fake upstream"""
+    return {name: fake.behaviour.stats() for name, fake in fakes.items()}
@@ -0,0 +1,327 @@
+"""
+Benchmark the API at fixed concurrency against fake TMDB and Gemini upstreams
+
+The app runs in-process (lifespan included) behind httpx's ASGI transport,
+with TMDB answered by benchmarks.fakes.FakeTMDB and the Gemini model
+replaced by FakeGemini. Everything else is real, including the database
+named by DATABASE_URL, so point it at a scratch SQLite file or Postgres
+database.
+
+Usage (from backend/):
+    python -m benchmarks.run recommend --concurrency 20 --requests 1000
+    python -m benchmarks.run mixed --gemini-latency 0.8 --error-rate 0.02 --json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import Counter, defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
+from unittest import mock
+
+import google.generativeai as genai
+import httpx
+
+from .fakes import make_fakes, upstream_stats
+
+# A request a scenario wants made: (operation, method, url, request kwargs)
+Request = Tuple[str, str, str, Dict]
+
+MOOD_TEMPLATES = [
+    "feeling {} after a long week",
+    "want something {} tonight",
+    "in a {} mood",
+    "need a {} movie with friends",
+    "kinda {} and nostalgic"
+]
+MOOD_WORDS = [
+    "happy", "sad", "anxious", "adventurous", "romantic", "bored", "curious",
+    "scared", "cozy", "energetic", "thoughtful", "silly", "lonely", "hopeful"
+]
+
+
+def mood_pool(size: int, seed: int) -> List[str]:
+    """Build `size` distinct moods; repeats across requests exercise the caches"""
+    rng = random.Random(seed)
+    moods = [template.format(word) for template in MOOD_TEMPLATES for word in MOOD_WORDS]
+    rng.shuffle(moods)
+    while len(moods) < size:
+        moods.append(f"{rng.choice(moods)} #{len(moods)}")
+    return moods[:size]
+
+
+def recommend(rng: random.Random, state: Dict) -> Request:
+    """POST /api/recommend for a mood from the pool, mostly first pages"""
+    page = 1 if rng.random() < 0.8 else 2
+    return "recommend", "POST", f"/api/recommend?page={page}", {"json": {"mood": rng.choice(state["moods"])}}
+
+
+def favourites(rng: random.Random, state: Dict) -> Request:
+    """List, add and remove favourites (60/25/15); removals target earlier adds"""
+    roll = rng.random()
+    if roll < 0.6:
+        return "favourites_list", "GET", "/api/favourites?limit=50", {}
+    if roll < 0.85 or not state["favourites"]:
+        movie_id = rng.randint(1, state["catalog_size"])
+        state["favourites"].append(movie_id)
+        return "favourites_add", "POST", "/api/favourites", {"json": {
+            "movie_id": movie_id,
+            "title": f"Benchmark Movie {movie_id}",
+            "vote_average": 7.0
+        }}
+    movie_id = state["favourites"].pop(rng.randrange(len(state["favourites"])))
+    return "favourites_remove", "DELETE", f"/api/favourites/{movie_id}", {}
+
+
+def history(rng: random.Random, state: Dict) -> Request:
+    """Page through /api/history, following X-Next-Cursor 30% of the time"""
+    cursor = state["cursors"].get("history")
+    if cursor and rng.random() < 0.3:
+        return "history", "GET", f"/api/history?limit=20&cursor={cursor}", {}
+    return "history", "GET", "/api/history?limit=20", {}
+
+
+def mixed(rng: random.Random, state: Dict) -> Request:
+    """Recommendations (50%), favourites (30%) and history (20%)"""
+    roll = rng.random()
+    if roll < 0.5:
+        return recommend(rng, state)
+    if roll < 0.8:
+        return favourites(rng, state)
+    return history(rng, state)
+
+
+SCENARIOS: Dict[str, Callable[[random.Random, Dict], Request]] = {
+    "recommend": recommend,
+    "favourites": favourites,
+    "history": history,
+    "mixed": mixed
+}
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(fraction * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def parse_server_timing(header: Optional[str]) -> Dict[str, float]:
+    """Parse a Server-Timing header into {stage: milliseconds}"""
+    stages = {}
+    for entry in (header or "").split(","):
+        name, _, duration = entry.strip().partition(";dur=")
+        if name and duration:
+            stages[name] = float(duration)
+    return stages
+
+
+class Results:
+    """Latencies, statuses, stage timings and mood sources collected during a run"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+        self.stages: Dict[str, Counter] = defaultdict(Counter)
+        # What resolved each recommendation's mood (cache, gemini, fallback...)
+        self.sources: Counter = Counter()
+        self.elapsed = 0.0
+
+    def record(self, operation: str, seconds: float, status: str, timing: Dict[str, float]) -> None:
+        self.latencies[operation].append(seconds)
+        self.statuses[operation][status] += 1
+        self.stages[operation].update(timing)
+
+    def summary(self) -> Dict:
+        """Throughput and latency percentiles per operation and overall"""
+        operations = {}
+        everything = []
+        for operation, latencies in sorted(self.latencies.items()):
+            everything += latencies
+            operations[operation] = self._summarize(latencies, self.statuses[operation])
+            operations[operation]["stages_ms"] = {
+                stage: round(total / len(latencies), 2)
+                for stage, total in sorted(self.stages[operation].items())
+            }
+        overall = self._summarize(everything, sum(self.statuses.values(), Counter()))
+        return {
+            "elapsed_s": round(self.elapsed, 3),
+            "overall": overall,
+            "operations": operations,
+            "mood_sources": dict(self.sources.most_common())
+        }
+
+    def _summarize(self, latencies: List[float], statuses: Counter) -> Dict:
+        ordered = sorted(latencies)
+        errors = sum(count for status, count in statuses.items() if not status.isdigit() or int(status) >= 500)
+        return {
+            "requests": len(ordered),
+            "errors": errors,
+            "throughput_rps": round(len(ordered) / self.elapsed, 2) if self.elapsed else 0.0,
+            "mean_ms": round(1000 * sum(ordered) / len(ordered), 2) if ordered else 0.0,
+            "p50_ms": round(1000 * percentile(ordered, 0.50), 2),
+            "p95_ms": round(1000 * percentile(ordered, 0.95), 2),
+            "p99_ms": round(1000 * percentile(ordered, 0.99), 2),
+            "statuses": dict(sorted(statuses.items()))
+        }
+
+
+async def drive(
+    client: httpx.AsyncClient,
+    scenario: Callable[[random.Random, Dict], Request],
+    state: Dict,
+    concurrency: int,
+    requests: int,
+    seed: int
+) -> Results:
+    """Send `requests` scenario requests from `concurrency` concurrent workers"""
+    results = Results()
+    remaining = iter(range(requests))
+
+    async def worker(number: int) -> None:
+        rng = random.Random(seed * 1000 + number)
+        for _ in remaining:
+            operation, method, url, kwargs = scenario(rng, state)
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+            except Exception as e:
+                results.record(operation, time.perf_counter() - start, type(e).__name__, {})
+                continue
+            results.record(
+                operation,
+                time.perf_counter() - start,
+                str(response.status_code),
+                parse_server_timing(response.headers.get("server-timing"))
+            )
+            if operation == "recommend" and response.status_code == 200:
+                results.sources[response.json().get("source")] += 1
+            if response.headers.get("x-next-cursor"):
+                state["cursors"][operation] = response.headers["x-next-cursor"]
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(number) for number in range(concurrency)))
+    results.elapsed = time.perf_counter() - start
+    return results
+
+
+async def run(args: argparse.Namespace) -> Dict:
+    """Start the app against the fakes, warm up, then measure the scenario"""
+    fakes = make_fakes(
+        tmdb_latency=args.tmdb_latency,
+        gemini_latency=args.gemini_latency,
+        error_rate=args.error_rate,
+        jitter=args.jitter,
+        seed=args.seed,
+        catalog_size=args.catalog_size
+    )
+    with mock.patch.object(genai, "GenerativeModel", lambda *_, **__: fakes["gemini"]):
+        from app.database import engine
+        from app.main import app
+        from app.services.tmdb_service import TMDBService
+
+        # The service keeps an open shared client instead of building its own
+        TMDBService._client = httpx.AsyncClient(transport=fakes["tmdb"].transport())
+        state = {
+            "moods": mood_pool(args.moods, args.seed),
+            "catalog_size": args.catalog_size,
+            "favourites": [],
+            "cursors": {}
+        }
+        scenario = SCENARIOS[args.scenario]
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+                if args.warmup:
+                    await drive(client, scenario, state, args.concurrency, args.warmup, args.seed + 1)
+                before = upstream_stats(fakes)
+                results = await drive(client, scenario, state, args.concurrency, args.requests, args.seed)
+                after = upstream_stats(fakes)
+
+    summary = results.summary()
+    summary["config"] = {
+        "scenario": args.scenario,
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "warmup": args.warmup,
+        "moods": args.moods,
+        "tmdb_latency": args.tmdb_latency,
+        "gemini_latency": args.gemini_latency,
+        "error_rate": args.error_rate,
+        "database": engine.url.render_as_string(hide_password=True)
+    }
+    summary["upstream_calls"] = {
+        name: {key: after[name][key] - before[name][key] for key in after[name]}
+        for name in after
+    }
+    return summary
+
+
+def print_report(summary: Dict) -> None:
+    """Print a summary as a table"""
+    config = summary["config"]
+    print(
+        f"scenario={config['scenario']} concurrency={config['concurrency']} requests={config['requests']} "
+        f"database={config['database']}"
+    )
+    print(
+        f"fake latency: tmdb={config['tmdb_latency']}s gemini={config['gemini_latency']}s "
+        f"error_rate={config['error_rate']}"
+    )
+    print()
+    header = f"{'operation':<20}{'requests':>9}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    print(header)
+    print("-" * len(header))
+    rows = [*summary["operations"].items(), ("overall", summary["overall"])]
+    for operation, stats in rows:
+        print(
+            f"{operation:<20}{stats['requests']:>9}{stats['errors']:>8}{stats['throughput_rps']:>10.1f}"
+            f"{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}"
+        )
+    print()
+    for operation, stats in summary["operations"].items():
+        stages = ", ".join(f"{stage}={ms}" for stage, ms in stats["stages_ms"].items() if stage != "total")
+        print(f"{operation}: statuses {stats['statuses']}; mean stage ms: {stages or '-'}")
+    calls = ", ".join(
+        f"{name}={counts['calls']} ({counts['errors']} failed)"
+        for name, counts in summary["upstream_calls"].items()
+    )
+    print(f"upstream calls: {calls}")
+    if summary["mood_sources"]:
+        print(f"mood sources: {', '.join(f'{source}={count}' for source, count in summary['mood_sources'].items())}")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("scenario", choices=sorted(SCENARIOS), help="Traffic to send")
+    parser.add_argument("--concurrency", type=int, default=10, help="Concurrent clients (default: 10)")
+    parser.add_argument("--requests", type=int, default=500, help="Measured requests (default: 500)")
+    parser.add_argument("--warmup", type=int, default=50, help="Unmeasured requests sent first (default: 50)")
+    parser.add_argument("--moods", type=int, default=50, help="Distinct moods in the pool (default: 50)")
+    parser.add_argument("--tmdb-latency", type=float, default=0.05, help="Fake TMDB latency in seconds (default: 0.05)")
+    parser.add_argument("--gemini-latency", type=float, default=0.5, help="Fake Gemini latency in seconds (default: 0.5)")
+    parser.add_argument("--jitter", type=float, default=0.25, help="Latency spread as a fraction (default: 0.25)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of fake upstream calls that fail (default: 0)")
+    parser.add_argument("--catalog-size", type=int, default=5000, help="Movies in the fake TMDB catalog (default: 5000)")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed (default: 1)")
+    parser.add_argument("--json", action="store_true", help="Print the summary as JSON")
+    parser.add_argument("--log-level", default="ERROR", help="App log level (default: ERROR)")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    logging.basicConfig(level=args.log_level)
+    logging.getLogger("uvicorn").setLevel(args.log_level)
+    summary = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print_report(summary)
+
+
+if __name__ == "__main__":
+    main()
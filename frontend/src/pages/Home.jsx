@@ -1,13 +1,13 @@
 /**
  * Home Page - Movie Discovery based on Mood
  */
-import { useState, useEffect, useCallback, useRef } from 'react';
+import { useState, useCallback, useRef } from 'react';
 import Hero from '../components/Hero';
 import MovieCard from '../components/MovieCard';
 import Pagination from '../components/Pagination';
 import LoadingSpinner from '../components/LoadingSpinner';
 import ExplanationSection from '../components/ExplanationSection';
-import { getRecommendations, addFavourite, getFavourites, removeFavourite } from '../services/api';
+import { getRecommendations, addFavourite, removeFavourite } from '../services/api';
 
 const Home = () => {
   const [movies, setMovies] = useState([]);
@@ -20,21 +20,6 @@ const Home = () => {
   const [favouriteIds, setFavouriteIds] = useState(new Set());
   const abortControllerRef = useRef(null);
   
-  const loadFavourites = useCallback(async () => {
-    try {
-      const favourites = await getFavourites();
-      const ids = new Set(favourites.map(f => f.movie_id));
-      setFavouriteIds(ids);
-    } catch (err) {
-      // Silent fail for favourites loading
-    }
-  }, []);
-  
-  // Load favourites on mount
-  useEffect(() => {
-    loadFavourites();
-  }, [loadFavourites]);
-  
   const handleSearch = useCallback(async (mood, page = 1) => {
     // Cancel previous request
     if (abortControllerRef.current) {
@@ -53,6 +38,12 @@ const Home = () => {
     try {
       const data = await getRecommendations(searchMood, page);
       setMovies(data.movies);
+      // Each movie carries its favourite flag, so no favourites list is needed
+      setFavouriteIds(prev => {
+        const newSet = new Set(prev);
+        data.movies.forEach(m => (m.is_favourite ? newSet.add(m.id) : newSet.delete(m.id)));
+        return newSet;
+      });
       setExplanation(data.explanation);
       setCurrentPage(data.page);
       setTotalPages(data.total_pages);
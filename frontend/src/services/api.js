@@ -33,6 +33,9 @@ export const TMDB_IMAGE_BASE = 'https://image.tmdb.org/t/p';
 export const POSTER_SIZE = 'w500';
 export const BACKDROP_SIZE = 'w1280';
 
+// Largest page GET /api/favourites serves
+const FAVOURITES_PAGE_SIZE = 500;
+
 /**
  * Get full image URL from TMDB path
  */
@@ -66,11 +69,19 @@ export const addFavourite = async (movie) => {
 };
 
 /**
- * Get all favourite movies
+ * Get all favourite movies, following X-Next-Cursor across pages
  */
 export const getFavourites = async () => {
-  const response = await api.get('/api/favourites');
-  return response.data;
+  const favourites = [];
+  let cursor = null;
+  do {
+    const response = await api.get('/api/favourites', {
+      params: { limit: FAVOURITES_PAGE_SIZE, ...(cursor && { cursor }) },
+    });
+    favourites.push(...response.data);
+    cursor = response.headers['x-next-cursor'];
+  } while (cursor);
+  return favourites;
 };
 
 /**